@@ -1,6 +1,19 @@
 from bot import OnekiBot
+from utils import env
+
+import launcher
 
 if __name__ == '__main__':
-    bot = OnekiBot()
-    bot.run()
+    if env.CLUSTER_COUNT > 1:
+        # the afk, blacklist and prefix state of each process assumes it is the only writer
+        if env.DB_BACKEND == "sqlite":
+            raise RuntimeError("DB_BACKEND=sqlite runs in a single process, CLUSTER_COUNT must be 1")
+        
+        if env.SHARD_COUNT is None:
+            raise RuntimeError("SHARD_COUNT is required to run more than one cluster")
 
+        launcher.launch(env.CLUSTER_COUNT, shard_count=env.SHARD_COUNT)
+    else:
+        # SHARD_COUNT=None lets discord decide how many shards to run
+        bot = OnekiBot(shard_count=env.SHARD_COUNT)
+        bot.run()
@@ -1,50 +1,57 @@
 import traceback
 import aiohttp
+import asyncio
+import graphlib
+import math
+import time
 import sys
 
 import utils
 from utils import translations, context, db, env, ui
+from utils.warmup import WarmUp, format_timings
+from utils.cache import AsyncLRUCache, LRUCache
+from utils.prefixes import PrefixMatcher
+from utils.profiler import StartupProfiler, counted
+from utils.router import MessageRouter, MessageInfo
+from utils.metrics import metrics, MetricsServer
+from utils.logs import LogShipper, format_error
+from utils.costs import attribute
+from utils.images import BannerCache, Renderer, StatsCards
+from utils.gateway import gateway_options
 from command_tree import CommandTree
-from typing import Union
+from typing import Optional, Union
+from collections import Counter
 
 
 description = """
 Hola!, soy Oneki un bot multitareas y estare muy feliz en ayudarte en los que necesites :D
 """
 
-initial_extensions = (
-    "cogs.user",
-    "cogs.clubs",
-    "cogs.counting",
-)
+# extension: extensions that must be loaded before it
+initial_extensions = {
+    "cogs.owner": (),
+    "cogs.user": (),
+    "cogs.clubs": (),
+    "cogs.counting": (),
+}
+
+
+DEFAULT_PREFIXES = ('?', '>')
 
 
 def _prefix_callable(bot, msg: utils.discord.Message):
-    user_id = bot.user.id
-    base = [f"<@!{user_id}> ", f"<@{user_id}> "]
-    if msg.guild is None:
-        base.append('?')
-        base.append('>')
-    else:
-        base.extend(bot.get_raw_guild_prefixes(msg.guild.id))
-    
-    return base
+    return bot.get_prefix_matcher(msg.guild).prefixes
 
 
-class OnekiBot(utils.commands.Bot):
+class OnekiBot(utils.commands.AutoShardedBot):
     version: str = "0.17a"
     
-    def __init__(self):
+    def __init__(self, *, cluster_id: int = 0, **kwargs):
         allowed_mentions = utils.discord.AllowedMentions(roles=False, everyone=False, users=True)
-        intents = utils.discord.Intents(
-            guilds=True,
-            members=True,
-            presences=True,
-            voice_states=True,
-            messages=True,
-            message_content=True,
-            bans=True
-        )
+        options = gateway_options(env.GATEWAY_PROFILE, message_cache_size=env.MESSAGE_CACHE_SIZE)
+        intents = options.pop("intents")
+        for key, value in options.items():
+            kwargs.setdefault(key, value)
         
         super().__init__(
             command_prefix=_prefix_callable,
@@ -52,11 +59,51 @@ class OnekiBot(utils.commands.Bot):
             allowed_mentions=allowed_mentions,
             intents=intents,
             case_insensitive=True,
-            tree_cls=CommandTree
+            tree_cls=CommandTree,
+            **kwargs
         )
         
+        self.profiler = StartupProfiler()
+        self.http.request = counted("rest", self.http.request)
+        
         self.db = db.async_client()
+        if env.DOCUMENT_CACHE_SIZE and env.DB_BACKEND == "firestore":
+            self.db.enable_cache(env.DOCUMENT_CACHE_SIZE, ttl=env.DOCUMENT_CACHE_TTL)
+            
+        self.writes = db.WriteBehind(self.db, max_pending=env.WRITE_BEHIND_MAX_PENDING, max_delay=env.WRITE_BEHIND_DELAY)
+        self.counters = db.ShardedCounter(
+            self.db, self.writes, shards=env.COUNTER_SHARDS, maxsize=env.DOCUMENT_CACHE_SIZE, ttl=env.DOCUMENT_CACHE_TTL
+        )
+        self.warmup = WarmUp(concurrency=env.WARMUP_CONCURRENCY)
+        
+        # prefixes[guild_id]: Optional[list], loaded the first time the guild is seen
+        # with the live mirrors the entries are kept up to date, they don't need to expire
+        self.prefixes = AsyncLRUCache(
+            self._get_guild_settings, env.GUILD_CACHE_SIZE, ttl=None if env.LIVE_MIRRORS else env.GUILD_CACHE_TTL
+        )
+        self.mirrors: list[Union[db.DocumentMirror, db.CollectionMirror]] = []
+        # guild_id: (raw prefixes, matcher), rebuilt only when the raw prefixes change
+        self._prefix_matchers = LRUCache(env.GUILD_CACHE_SIZE)
+        # stage: messages rejected there, plus the ones dispatched as commands
+        self.message_stats = Counter()
+        self.router = MessageRouter(self)
+        
+        # each cluster serves its metrics on PORT + cluster_id
+        self.cluster_id = cluster_id
+        self.metrics_server = MetricsServer()
+        
         self.debug_channel_id = env.DEBUG_CHANNEL
+        self.debug_channel = None
+        # errors and ctx.log entries, shipped to stderr and the debug channel in batches
+        self.logs = LogShipper(maxsize=env.LOG_QUEUE_SIZE, interval=env.LOG_FLUSH_INTERVAL)
+        self.renderer = Renderer(
+            workers=env.RENDER_WORKERS, 
+            max_queue=env.RENDER_QUEUE_SIZE, 
+            timeout=env.RENDER_TIMEOUT,
+            processes=env.RENDER_PROCESSES
+        )
+        # default profile banners already uploaded, by colour and size
+        self.banners = BannerCache(self, path=env.BANNER_CACHE_PATH)
         self.bot_emojis = {
             "enojao": "<:enojao:989312639744233502>",
             "yes": "<:yes:885693508533489694>",
@@ -64,97 +111,260 @@ class OnekiBot(utils.commands.Bot):
             "disgustado": "<:perturbado:897292618692718622>"
         }
 
-    async def _get_guild_settings(self):
-        # guild_id: list
-        prefixes = {}
-        
-        collection_ref = self.db.collection("guilds")
-        async for doc_ref in collection_ref.list_documents():
-            doc = await doc_ref.get()
-            if doc.exists: 
-                data = doc.to_dict()
-                if data.get("prefixes") is not None:
-                    prefixes[doc.id] = data.get("prefixes")
-        
-        return prefixes
+    async def _get_guild_settings(self, guild_id: int):
+        doc = await self.db.document(f"guilds/{guild_id}").get()
+        if doc.exists:
+            return doc.to_dict().get("prefixes")
 
     async def _get_blacklist(self):
-        # {users: {id, ...}, guilds: {id, ...}}
+        # {users: {int id, ...}, guilds: {int id, ...}}
         blacklist = {"users": set(), "guilds": set()}
 
-        guilds_doc = await self.db.document("blacklist/guilds").get()
-        if guilds_doc.exists:
-            blacklist["guilds"] = set(guilds_doc.to_dict().keys())
-            
-        users_doc = await self.db.document("blacklist/users").get()
-        if users_doc.exists:
-            blacklist["users"] = set(users_doc.to_dict().keys())
+        doc_refs = [self.db.document("blacklist/guilds"), self.db.document("blacklist/users")]
+        async for doc in self.db.get_all(doc_refs):
+            if doc.exists:
+                blacklist[doc.id] = {int(object_id) for object_id in doc.to_dict().keys()}
         
         return blacklist
 
+    async def _mirror_blacklist(self):
+        blacklist = {"users": set(), "guilds": set()}
+        
+        def apply(ids: set[int], data: dict):
+            # in place, the sets are the ones checked by classify_message
+            current = {int(object_id) for object_id in data}
+            ids.intersection_update(current)
+            ids.update(current)
+        
+        mirrors = [
+            self.add_mirror(db.DocumentMirror(f"blacklist/{kind}", lambda data, ids=ids: apply(ids, data)))
+            for kind, ids in blacklist.items()
+        ]
+        try:
+            await asyncio.gather(*[mirror.wait_ready(env.MIRROR_READY_TIMEOUT) for mirror in mirrors])
+        except asyncio.TimeoutError:
+            print("[-] Blacklist snapshot listeners not ready, reading it once")
+            for mirror in mirrors:
+                self.remove_mirror(mirror)
+                
+            return await self._get_blacklist()
+        
+        return blacklist
+    
+    def _apply_guild_settings(self, changes: dict[str, Optional[dict]]):
+        for guild_id, data in changes.items():
+            # the prefixes are loaded through the document cache, its snapshot is stale now
+            self.db.invalidate(f"guilds/{guild_id}")
+            guild_id = int(guild_id)
+            # only the guilds already cached, the rest are loaded when seen
+            if guild_id in self.prefixes:
+                self.prefixes.set(guild_id, data.get("prefixes") if data is not None else None)
+            else:
+                # a load running now may return the previous prefixes
+                self.prefixes.invalidate(guild_id)
+    
+    def add_mirror(self, mirror: Union[db.DocumentMirror, db.CollectionMirror]):
+        """Starts the mirror, it is closed with the bot"""
+        mirror.start()
+        self.mirrors.append(mirror)
+        return mirror
+    
+    def remove_mirror(self, mirror: Union[db.DocumentMirror, db.CollectionMirror]):
+        mirror.close()
+        self.mirrors.remove(mirror)
+
     def get_guild_prefixes(self, guild, *, local_inject=_prefix_callable):
         proxy_msg = utils.discord.Object(id=0)
         proxy_msg.guild = guild
         return local_inject(self, proxy_msg)
 
     def get_raw_guild_prefixes(self, guild_id):
-        return self.prefixes.get(str(guild_id), ['?', '>'])
+        # an empty list is kept, the guild only answers to mentions
+        prefixes = self.prefixes.peek(guild_id)
+        return prefixes if prefixes is not None else DEFAULT_PREFIXES
+    
+    async def _load_guild_prefixes(self, guild_id: int):
+        try:
+            await self.prefixes.fetch(guild_id)
+        except Exception as e:
+            # the message is handled with the default prefixes, the next one loads them again
+            self.logs.push(format_error(f"Loading the prefixes of {guild_id}:", e))
+
+    def get_prefix_matcher(self, guild) -> PrefixMatcher:
+        guild_id = guild.id if guild is not None else None
+        raw = self.get_raw_guild_prefixes(guild_id) if guild is not None else DEFAULT_PREFIXES
+        
+        cached = self._prefix_matchers.peek(guild_id)
+        if cached is None or cached[0] is not raw:
+            user_id = self.user.id
+            cached = (raw, PrefixMatcher([f"<@!{user_id}> ", f"<@{user_id}> ", *raw]))
+            self._prefix_matchers.set(guild_id, cached)
+        
+        return cached[1]
+
+    async def get_prefix(self, message: utils.discord.Message):
+        if message.guild is not None:
+            await self._load_guild_prefixes(message.guild.id)
+        
+        # give discord.py the prefix already matched so it does not scan every prefix again
+        matcher = self.get_prefix_matcher(message.guild)
+        return matcher.match(message.content) or list(matcher.prefixes)
+
+    def owns_guild(self, guild_id: int) -> bool:
+        """Whether the guild belongs to one of the shards run by this process"""
+        if self.shard_ids is None or self.shard_count is None:
+            return True
+        
+        return (int(guild_id) >> 22) % self.shard_count in self.shard_ids
 
     def get_guild_lang(self, guild):
         return guild.preferred_locale.value.split("-")[0]
 
     async def add_to_blacklist(self, object: Union[utils.discord.User, utils.discord.Guild], *, reason=None):
         doc_ref = self.db.document(f"blacklist/{'guilds' if isinstance(object, utils.discord.Guild) else 'users'}")
-        await doc_ref.set({str(object.id): reason})
+        await doc_ref.set({str(object.id): reason}, merge=True)
         
-        self.blacklist["guilds" if isinstance(object, utils.discord.Guild) else "users"].add(str(object.id))
+        self.blacklist["guilds" if isinstance(object, utils.discord.Guild) else "users"].add(object.id)
 
     async def remove_from_blacklist(self, object: Union[utils.discord.User, utils.discord.Guild]):
         doc_ref = self.db.document(f"blacklist/{'guilds' if isinstance(object, utils.discord.Guild) else 'users'}")
         blacklist = self.blacklist['guilds' if isinstance(object, utils.discord.Guild) else 'users']
-        if not str(object.id) in blacklist:
+        if not object.id in blacklist:
             raise Exception(f"{object.id} not in blacklist")
 
         await doc_ref.delete(str(object.id))
-        blacklist.remove(str(object.id))
+        blacklist.remove(object.id)
 
-    def in_blacklist(self, object: Union[utils.discord.User, utils.discord.Guild]):
+    def in_blacklist(self, object: Union[utils.discord.User, utils.discord.Guild, None]):
+        if object is None:
+            return False
+        
         if isinstance(object, utils.discord.Guild):
             return True if object.id in self.blacklist["guilds"] else False
         
         return True if object.id in self.blacklist["users"] else False
 
-    async def load_extensions(self, extensions):
-        for ext in extensions:
+    async def load_extensions(self, extensions: dict[str, tuple[str, ...]]):
+        for ext, dependencies in extensions.items():
+            for dependency in dependencies:
+                if dependency not in extensions:
+                    raise ValueError(f"{ext} depends on {dependency}, which is not going to be loaded")
+        
+        # raises graphlib.CycleError before anything is loaded
+        graphlib.TopologicalSorter(extensions).prepare()
+        
+        tasks: dict[str, asyncio.Task] = {}
+        timings: dict[str, float] = {}
+        
+        async def load(ext) -> bool:
+            for dependency in extensions[ext]:
+                if not await tasks[dependency]:
+                    print(f"Skipping extension {ext}, {dependency} failed to load.", file=sys.stderr)
+                    return False
+            
+            start = time.perf_counter()
             try:
                 await self.load_extension(ext)
-            except Exception as e:
+            except Exception:
                 print(f"Failed to load extension {ext}.", file=sys.stderr)
                 traceback.print_exc()
+                return False
+            finally:
+                timings[ext] = time.perf_counter() - start
+            
+            return True
+        
+        for ext in extensions:
+            tasks[ext] = asyncio.create_task(load(ext))
+        
+        # independent extensions load concurrently, a failing one only skips its dependents
+        await asyncio.gather(*tasks.values())
+        print(format_timings("Extensions", timings))
 
     async def setup_hook(self) -> None:
-        self.session = aiohttp.ClientSession(
-            loop=self.loop,
-            headers={"User-Agent": f"OnekiBot/{self.version} (+https://github.com/OnekiDevs/oneki-py)"}
-        )
+        with self.profiler.phase("setup_hook"):
+            await self._setup()
         
-        # prefixes[guild_id]: list
-        self.prefixes = await self._get_guild_settings()
+        print(self.profiler.report())
 
-        # user_id mapped to True
-        # these are users globally blacklisted
-        self.blacklist = await self._get_blacklist()
+    async def _setup(self) -> None:
+        phase = self.profiler.phase
+        
+        with phase("session"):
+            self.session = aiohttp.ClientSession(
+                loop=self.loop,
+                headers={"User-Agent": f"OnekiBot/{self.version} (+https://github.com/OnekiDevs/oneki-py)"}
+            )
+        
+        # blacklist: users and guilds globally blacklisted
+        with phase("blacklist"):
+            self.blacklist, = await self.warmup.gather(
+                blacklist=self._mirror_blacklist() if env.LIVE_MIRRORS else self._get_blacklist()
+            )
+        
+        # guild settings: the cached prefixes are updated by the changes of the guilds with prefixes,
+        # ordering by the field leaves out the documents without it
+        if env.LIVE_MIRRORS:
+            self.add_mirror(db.CollectionMirror(
+                "guilds", self._apply_guild_settings, query=lambda guilds: guilds.order_by("prefixes")
+            ))
         
         if self.debug_channel_id is not None:
-            self.debug_channel = await self.fetch_channel(int(self.debug_channel_id))
-            
-        self.translations = translations.Translations.load()
+            with phase("debug_channel"):
+                self.debug_channel = await self.fetch_channel(int(self.debug_channel_id))
+        
+        self.logs.start(self.debug_channel)
+        self.writes.start()
+        
+        with phase("translations"):
+            self.translations = translations.Translations.load(bundle_path=env.TRANSLATIONS_BUNDLE_PATH)
+        
+        with phase("templates"):
+            self.stats_cards = StatsCards(self.renderer)
         
         # cogs unload
-        await self.load_extensions(initial_extensions)
+        with phase("extensions"):
+            await self.load_extensions(initial_extensions)
+        print(self.warmup.report())
+        
+        if env.PORT is not None:
+            with phase("metrics_server"):
+                self._register_gauges()
+                await self.metrics_server.start(int(env.PORT) + self.cluster_id)
+        
+        # sync, only when the commands changed
+        # commands are global, so in cluster mode only the process owning shard 0 syncs
+        with phase("tree_sync"):
+            if self.shard_ids is not None and 0 not in self.shard_ids:
+                print("[+] Command tree sync left to the cluster owning shard 0")
+            elif not await self.tree.sync_if_changed(path=env.TREE_HASH_PATH, force=env.FORCE_TREE_SYNC):
+                print("[+] Command tree unchanged, sync skipped")
+    
+    def _register_gauges(self):
+        metrics.gauges.update({
+            "oneki_gateway_latency_seconds": lambda: None if math.isnan(self.latency) else self.latency,
+            "oneki_prefixes_cache_size": lambda: len(self.prefixes),
+            "oneki_blacklist_users_size": lambda: len(self.blacklist["users"]),
+            "oneki_blacklist_guilds_size": lambda: len(self.blacklist["guilds"]),
+            "oneki_render_queue_depth": lambda: self.renderer.depth,
+            "oneki_write_behind_pending": lambda: len(self.writes),
+            "oneki_firestore_queue_depth": lambda: self.db.queued,
+            "oneki_firestore_in_flight": lambda: self.db.in_flight,
+        })
         
-        # sync
-        await self.tree.sync()
+        if self.db.cache is not None:
+            metrics.gauges.update({
+                "oneki_document_cache_size": lambda: len(self.db.cache),
+                "oneki_document_cache_hits": lambda: self.db.cache.hits,
+                "oneki_document_cache_misses": lambda: self.db.cache.misses,
+                "oneki_document_cache_joins": lambda: self.db.cache.joins,
+                "oneki_document_cache_evictions": lambda: self.db.cache.evictions,
+            })
+    
+    async def add_cog(self, cog: utils.commands.Cog, **kwargs) -> None:
+        # add_cog awaits cog_load, so its phase covers the cog warm-up
+        with self.profiler.phase(f"cog_load:{cog.qualified_name}"):
+            await super().add_cog(cog, **kwargs)
                 
     async def on_ready(self):
         activity = utils.discord.Activity(type=utils.discord.ActivityType.watching, name=f"{len(self.guilds)} servidores")
@@ -181,9 +391,7 @@ class OnekiBot(utils.commands.Bot):
         else:
             await ctx.send(f"{err.__class__.__name__}: {err}")
 
-        print(f"In {ctx.command.qualified_name}:", file=sys.stderr)
-        traceback.print_tb(err.__traceback__)
-        print(f"{err.__class__.__name__}: {err}", file=sys.stderr)
+        self.logs.push(format_error(f"In {ctx.command.qualified_name}:", err))
 
     async def get_context(
         self, 
@@ -193,20 +401,71 @@ class OnekiBot(utils.commands.Bot):
     ):
         return await super().get_context(origin, cls=cls)
 
-    async def process_commands(self, message: utils.discord.Message):
-        ctx = await self.get_context(message)
-
+    def _reject_message(self, message: utils.discord.Message) -> Optional[str]:
+        """Cheap integer checks done before classifying the message (prefix read, router), returns the rejecting stage"""
         if message.author.bot:
-            return
+            return "bot"
 
-        if self.in_blacklist(ctx.author) or self.in_blacklist(ctx.guild):
+        if message.author.id in self.blacklist["users"]:
+            return "blacklist"
+        
+        if message.guild is not None and message.guild.id in self.blacklist["guilds"]:
+            return "blacklist"
+
+    async def classify_message(self, message: utils.discord.Message) -> MessageInfo:
+        if message.guild is not None:
+            await self._load_guild_prefixes(message.guild.id)
+        
+        prefix = self.get_prefix_matcher(message.guild).match(message.content)
+        return self.router.classify(message, prefix)
+
+    async def process_commands(self, message: utils.discord.Message, info: Optional[MessageInfo] = None):
+        if info is None:
+            stage = self._reject_message(message)
+            if stage is not None:
+                self.message_stats[stage] += 1
+                return
+            
+            info = await self.classify_message(message)
+        
+        # only the messages carrying a prefix get a Context
+        if info.prefix is None:
+            self.message_stats["no_prefix"] += 1
             return
 
+        self.message_stats["dispatched"] += 1
+        ctx = await self.get_context(message)
         await self.invoke(ctx)
 
+    async def invoke(self, ctx: context.Context):
+        start = time.perf_counter()
+        try:
+            name = ctx.command.qualified_name if ctx.command is not None else "unknown"
+            with attribute(f"command:{name}", ctx.guild.id if ctx.guild is not None else None):
+                await super().invoke(ctx)
+        finally:
+            if ctx.command is not None:
+                metrics.observe_command(ctx.command.qualified_name, time.perf_counter() - start)
+
+    def dispatch(self, event_name: str, *args, **kwargs):
+        metrics.events[event_name] += 1
+        # the listener tasks copy the context, so their firestore calls are charged to the event
+        guild = None
+        if args:
+            guild = args[0] if isinstance(args[0], utils.discord.Guild) else getattr(args[0], "guild", None)
+            
+        with attribute(f"event:{event_name}", getattr(guild, "id", None)):
+            super().dispatch(event_name, *args, **kwargs)
+
     async def on_message(self, message: utils.discord.Message):
-        if message.author.bot:
+        stage = self._reject_message(message)
+        if stage is not None:
+            self.message_stats[stage] += 1
             return
+        
+        # classified once, the cogs register their interest in the router instead of listening on_message
+        info = await self.classify_message(message)
+        self.router.dispatch(message, info)
 
         # if the bot is mentioned
         if message.content in [f'<@!{self.user.id}>', f'<@{self.user.id}>']:
@@ -218,10 +477,21 @@ class OnekiBot(utils.commands.Bot):
                 p = ", ".join([prefix for prefix in prefixes])
                 await message.channel.send(translation.more.format(p))
 
-        await self.process_commands(message)
+        await self.process_commands(message, info)
 
     async def close(self):
+        # the last logs are sent while discord's http session is still open
+        await self.logs.close()
         await super().close()
+        await self.metrics_server.stop()
+        await self.writes.close()
+        for mirror in self.mirrors:
+            mirror.close()
+            
+        if env.DB_BACKEND == "sqlite":
+            self.db.close()
+            
+        self.renderer.close()
         await self.session.close()
         print("goodbye!")
 
@@ -3,6 +3,7 @@ from utils import ui, db
 from utils.ui import confirm
 from typing import AsyncGenerator, Optional, Coroutine, TYPE_CHECKING
 
+import asyncio
 import io
 import json
 import yaml
@@ -50,9 +51,9 @@ class Club:
         club.is_nsfw = data["nsfw"]
         club.banner_url = data.get("banner")
 
-        for mid in data["members"]:
-            member = await club._fetch_member(int(mid))
-            club.members[int(mid)] = member
+        member_ids = [int(mid) for mid in data["members"]]
+        members = await club._fetch_members(member_ids)
+        club.members = {mid: members[mid] for mid in member_ids}
             
         for mid in data.get("mods", []):
             member = club.members[int(mid)]
@@ -66,12 +67,32 @@ class Club:
             
         return club
     
-    async def _fetch_member(self, member_id: int) -> utils.discord.Member:
-        member = self.guild.get_member(member_id)
-        if member is None:
-            member = await self.guild.fetch_member(member_id)
+    async def _fetch_members(self, member_ids: list[int]) -> dict[int, utils.discord.Member]:
+        # the lean gateway profile caches almost no members, the missing ones are
+        # requested through the gateway 100 at a time instead of one fetch each
+        members, missing = {}, []
+        for member_id in member_ids:
+            member = self.guild.get_member(member_id)
+            if member is not None:
+                members[member_id] = member
+            else:
+                missing.append(member_id)
+        
+        cache = self.guild._state.member_cache_flags.joined
+        for i in range(0, len(missing), 100):
+            try:
+                found = await self.guild.query_members(user_ids=missing[i:i + 100], limit=100, cache=cache)
+            except asyncio.TimeoutError:
+                break
+                
+            members.update((member.id, member) for member in found)
+        
+        # not returned by the query, fetched like before (it raises for the ones that left)
+        for member_id in missing:
+            if member_id not in members:
+                members[member_id] = await self.guild.fetch_member(member_id)
             
-        return member
+        return members
     
     def get_member(self, member_id: int) -> utils.discord.Member:
         return self.members.get(member_id)
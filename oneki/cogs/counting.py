@@ -1,7 +1,9 @@
 import utils
+from utils.metrics import metrics
 from utils import ui
 from utils.ui import confirm
 from utils.context import Context
+from utils.logs import format_error
 from typing import Optional, AsyncGenerator, TYPE_CHECKING
 
 import math
@@ -180,18 +182,42 @@ class Counting(utils.Cog):
 
     async def cog_load(self):
         await self.get_countings() 
+        metrics.gauges["oneki_countings_size"] = lambda: len(self.countings)
+
+    async def cog_unload(self):
+        self.bot.router.remove_handler(self.on_counting_message)
+        metrics.gauges.pop("oneki_countings_size", None)
 
     async def get_countings(self):
         db = self.bot.db
-        async for doc_ref in db.collection("countings").list_documents():
-            if doc_ref.id != "users":
-                doc = await doc_ref.get()
-                try:
-                    self.countings[int(doc_ref.id)] = CountingStruct(
-                        doc.to_dict(), guild=await self.bot.fetch_guild(doc_ref.id)
-                    )
-                except utils.discord.Forbidden:
-                    continue
+        docs = [
+            doc async for doc in db.collection("countings").stream() 
+            if doc.id != "users" and self.bot.owns_guild(doc.id)
+        ]
+        
+        # the guilds are fetched concurrently, bounded by the warm-up concurrency cap
+        guilds = await self.bot.warmup.map("countings", lambda doc: self.bot.fetch_guild(int(doc.id)), docs)
+        for doc, guild in zip(docs, guilds):
+            if isinstance(guild, utils.discord.Forbidden):
+                continue
+            elif isinstance(guild, Exception):
+                raise guild
+            
+            counting = CountingStruct(doc.to_dict(), guild=guild)
+            self.countings[int(doc.id)] = counting
+            self.bot.router.watch_channel(counting.channel_id, self.on_counting_message)
+
+    async def stats_card(self, **kwargs) -> Optional[utils.discord.File]:
+        # a render failing or timing out leaves the embed without the card instead of failing the command
+        try:
+            return await self.bot.stats_cards.get(**kwargs)
+        except Exception as e:
+            self.bot.logs.push(format_error("In stats card:", e))
+
+    def buffer_counting(self, guild_id: int, counting: CountingStruct, data: dict):
+        # a message handled while the counting was disabled (or replaced) must not recreate the document
+        if self.countings.get(guild_id) is counting:
+            self.bot.writes.update(f"countings/{guild_id}", data)
 
     async def update_counting(self, doc_ref, guild_id, key, value): 
         await doc_ref.update({key: value})
@@ -210,15 +236,19 @@ class Counting(utils.Cog):
         counting = self.countings.get(ctx.guild.id)
         if counting is not None:
             if counting.channel_id != channel.id:
+                self.bot.router.unwatch_channel(counting.channel_id)
                 counting.channel_id = channel.id
+                self.bot.router.watch_channel(channel.id, self.on_counting_message)
             
             if fail_role is not None:
                 counting.fail_role_id = fail_role.id
                 
             if numbers_only is not None:
                 counting.numbers_only = numbers_only
-                
-            await doc_ref.update(counting.to_dict())
+            
+            # the pending counting writes are older than this state
+            async with self.bot.writes.direct(doc_ref.path):
+                await doc_ref.update(counting.to_dict())
         else:
             data = {
                 "channel": str(channel.id)
@@ -231,7 +261,9 @@ class Counting(utils.Cog):
                 data["numbers_only"] = numbers_only
             
             self.countings[ctx.guild.id] = CountingStruct(data, guild=ctx.guild)
-            await doc_ref.set(data)
+            self.bot.router.watch_channel(channel.id, self.on_counting_message)
+            async with self.bot.writes.direct(doc_ref.path):
+                await doc_ref.set(data)
             
         await ctx.send(ctx.translation.success)
 
@@ -245,8 +277,12 @@ class Counting(utils.Cog):
         if view.value is None:
             await ctx.send(ctx.translation.confirm.timeout)
         elif view.value:
-            await doc_ref.delete()
-            self.countings.pop(doc_ref.id)
+            # popped first, the messages being handled stop buffering writes that would recreate the document
+            counting = self.countings.pop(ctx.guild.id)
+            async with self.bot.writes.direct(doc_ref.path):
+                await doc_ref.delete()
+                
+            self.bot.router.unwatch_channel(counting.channel_id)
             
             await ctx.send(ctx.translation.confirm.ok)
         else:
@@ -278,15 +314,26 @@ class Counting(utils.Cog):
                 
                 by = await ctx.guild.fetch_member(int(counting.current_number["by"]))
                 embed.add_field(name=ctx.translation.embed.fields[3], value=f"```{by}```", inline=False)
+            
+            record, current = counting.record["num"], counting.current_number["num"]
+            files = []
+            file = await self.stats_card(
+                left=(ctx.translation.card.left, str(record)),
+                right=(ctx.translation.card.right, str(current)),
+                progress=(current * 100 / record) if record else 0.0
+            )
+            if file is not None:
+                embed.set_image(url=f"attachment://{file.filename}")
+                files.append(file)
                 
-            await ctx.send(embed=embed)
+            await ctx.send(embed=embed, files=files)
         else:
             await ctx.send(ctx.translation.not_there_server_stats)
             
     @utils.commands.hybrid_command()
     async def user_stats(self, ctx: Context, member: utils.discord.Member = None):
         member = member or ctx.author
-        doc = await ctx.db.document(f"users/{member.id}").get()
+        data = await self.bot.counters.get(f"users/{member.id}")
         embed = utils.discord.Embed(
             colour=utils.discord.Colour.purple(),
             timestamp=utils.utcnow()
@@ -294,7 +341,7 @@ class Counting(utils.Cog):
 
         embed.set_author(name=member, icon_url=member.display_avatar.url)
         
-        data = doc.to_dict() or {}
+        files = []
         if global_stats := data.get("countings"):
             correct = global_stats.get("correct", 0)
             incorrect = global_stats.get("incorrect", 0)
@@ -312,6 +359,15 @@ class Counting(utils.Cog):
             )
             embed.add_field(name="🌍 " + ctx.translation.embed.fields_names[0], value=content)
             
+            file = await self.stats_card(
+                left=(ctx.translation.card.left, str(correct)),
+                right=(ctx.translation.card.right, str(incorrect)),
+                progress=correct_rate
+            )
+            if file is not None:
+                embed.set_image(url=f"attachment://{file.filename}")
+                files.append(file)
+            
         server_stats = self.countings.get(ctx.guild.id)
         if server_stats is not None:
             server_stats = server_stats.users.get(str(member.id))
@@ -332,25 +388,12 @@ class Counting(utils.Cog):
             )
             embed.add_field(name="📦 " + ctx.translation.embed.fields_names[1], value=content)
 
-        await ctx.send(embed=embed)
+        await ctx.send(embed=embed, files=files)
            
     async def update_user_stats(self, *, guild_id: int, user_id: int, correct: bool):
-        db = self.bot.db
-        
-        doc_ref = db.document(f"users/{user_id}")
-        doc = await doc_ref.get()
-        if doc.exists:
-            if correct:
-                await doc_ref.update({"countings.correct": db.Increment(1)})
-            else:
-                await doc_ref.update({"countings.incorrect": db.Increment(1)})
-        else:
-            await doc_ref.set({
-                "countings": {
-                    "correct": 1 if correct else 0,
-                    "incorrect": 0 if correct else 1
-                }
-            })
+        # sharded and buffered, the write-behind merges the increments of a busy channel
+        field = "countings.correct" if correct else "countings.incorrect"
+        self.bot.counters.increment(f"users/{user_id}", field)
         
         counting = self.countings.get(guild_id)
         if counting.users:
@@ -420,11 +463,8 @@ class Counting(utils.Cog):
             await utils.asyncio.sleep(43200.0)            
             await member.remove_roles(fail_role)
     
-    @utils.Cog.listener()
-    async def on_message(self, message: utils.discord.Message): 
-        if message.author.bot:
-            return
-        
+    # the router only calls this for messages in a counting channel
+    async def on_counting_message(self, message: utils.discord.Message, info: utils.MessageInfo): 
         counting = self.countings.get(message.guild.id)
         if counting is not None:
             if message.channel.id == counting.channel_id:
@@ -471,7 +511,11 @@ class Counting(utils.Cog):
                         correct=True
                     )
                     
-                    await doc_ref.update(counting.to_dict())
+                    # only the fields counting changes, the settings are written directly by count_settings
+                    payload = counting.to_dict()
+                    self.buffer_counting(message.guild.id, counting, {
+                        key: payload[key] for key in ("current_number", "record", "users") if key in payload
+                    })
                     return
                 
                 translation = self.translations.event(self.bot.get_guild_lang(message.guild), "counting")
@@ -495,7 +539,7 @@ class Counting(utils.Cog):
                 await self.pin(counting, message.channel)
                 
                 counting.current_number = {"num": 0}
-                await doc_ref.delete(camp="current_number")
+                self.buffer_counting(message.guild.id, counting, {"current_number": db.DELETE_FIELD})
                 await self.add_fail_role(counting, message.author)
                             
     
@@ -0,0 +1,33 @@
+import utils
+from utils.context import Context
+from utils.costs import ledger
+
+import io
+import json
+
+
+class Owner(utils.Cog):
+    async def cog_check(self, ctx: Context) -> bool:
+        return await self.bot.is_owner(ctx.author)
+
+    @utils.commands.command()
+    async def startup_report(self, ctx: Context):
+        file = utils.discord.File(
+            fp=io.StringIO(json.dumps(self.bot.profiler.to_dict(), indent=4)),
+            filename="startup_report.json"
+        )
+        await ctx.send(f"```\n{self.bot.profiler.report()}\n```", file=file)
+
+    @utils.commands.command()
+    async def cost_report(self, ctx: Context):
+        """Firestore calls and documents by command, handler and event, and by guild, since the start"""
+        data = {"version": self.bot.version, "cluster_id": self.bot.cluster_id, **ledger.to_dict()}
+        file = utils.discord.File(
+            fp=io.StringIO(json.dumps(data, indent=4)),
+            filename=f"cost_report-{self.bot.version}.json"
+        )
+        await ctx.send(f"```\n{ledger.report()}\n```", file=file)
+
+
+async def setup(bot):
+    await bot.add_cog(Owner(bot))
@@ -1,60 +1,75 @@
 import utils
-from utils import ui
+from utils.metrics import metrics
+from utils import db, env, ui
 from utils.context import Context
+from utils.embeds import EmbedTemplate, TemplateCache
 
-import os
-from PIL import Image
 from typing import Optional
+import asyncio
+
+
+# the static part of the embeds per locale, keyed by their translation
+AFK_EMBEDS = TemplateCache(lambda translation: EmbedTemplate(
+    utils.discord.Embed(color=0xFCE64C), title=translation.embed.title, description=translation.embed.reason
+))
+NO_LONGER_AFK_EMBEDS = TemplateCache(lambda translation: EmbedTemplate(
+    utils.discord.Embed(color=0xFCE64C), title=translation.no_longer_afk
+))
+AVATAR_EMBEDS = TemplateCache(lambda translation: EmbedTemplate(
+    utils.discord.Embed(), author__name=translation.embed.author, footer__text=translation.embed.footer
+))
+INFO_EMBEDS = TemplateCache(lambda translation: EmbedTemplate(
+    utils.discord.Embed(title=translation.embed.title), footer__text=translation.embed.footer
+))
 
 
 def avatar_embed(member: utils.discord.Member, author: utils.discord.Member, translation):
     avatar = member.display_avatar.url
     
-    embed = utils.discord.Embed(colour=member.color, timestamp=utils.utcnow())
-    embed.set_author(name=translation.embed.author.format(member), url=avatar)
-    embed.set_image(url=avatar)
-    embed.set_footer(text=translation.embed.footer.format(author.name), icon_url=author.avatar.url)
-    
-    return embed
+    return AVATAR_EMBEDS.get(translation).render(
+        color=member.color.value,
+        timestamp=utils.utcnow(),
+        author__name=member,
+        author__url=avatar,
+        image__url=avatar,
+        footer__text=author.name,
+        footer__icon_url=author.avatar.url
+    )
 
 
-def info_embed(member: utils.discord.Member, author: utils.discord.Member, translation):
+def info_embed(member: utils.discord.Member, author: utils.discord.Member, translation, *, presences: bool):
     roles = "".join([
         role.mention for role in member.roles 
         if role != member.guild.default_role
     ])
-
-    embed = utils.discord.Embed(
-        title=translation.embed.title,
-        description=roles,
-        color=member.color,
-        timestamp=utils.utcnow(), 
-    )
-    embed.set_author(name=f"{member}", url=member.avatar.url).set_thumbnail(url=member.avatar.url)
     
-    if member.activity is not None: 
+    names, fields = translation.embed.fields, []
+    # without the presences intent (lean gateway profile) there is no activity or status to show
+    if presences and member.activity is not None: 
         activity = member.activity if isinstance(member.activity, utils.discord.CustomActivity) else member.activity.name
-        embed.add_field(name=translation.embed.fields[0], value=f"```{activity}```", inline=False)
+        fields.append({"name": names[0], "value": f"```{activity}```", "inline": False})
     
-    embed.add_field(
-        name=translation.embed.fields[1], 
-        value=utils.discord.utils.format_dt(member.created_at, "F")
-    ).add_field(
-        name=translation.embed.fields[2], 
-        value=utils.discord.utils.format_dt(member.joined_at, "F")
-    ).add_field(
-        name=translation.embed.fields[3], value=f"```{member.color}```"
-    ).add_field(
-        name=translation.embed.fields[4], value=f"```{member.id}```"
-    ).add_field(
-        name=translation.embed.fields[5], value=f"```{member.raw_status}```"
-    )
+    fields += [
+        {"name": names[1], "value": utils.discord.utils.format_dt(member.created_at, "F"), "inline": True},
+        {"name": names[2], "value": utils.discord.utils.format_dt(member.joined_at, "F"), "inline": True},
+        {"name": names[3], "value": f"```{member.color}```", "inline": True},
+        {"name": names[4], "value": f"```{member.id}```", "inline": True}
+    ]
     
-    embed.set_footer(
-        text=translation.embed.footer.format(author.name), icon_url=author.avatar.url
-    )
+    if presences:
+        fields.append({"name": names[5], "value": f"```{member.raw_status}```", "inline": True})
     
-    return embed
+    return INFO_EMBEDS.get(translation).render(
+        description=roles or None,
+        color=member.color.value,
+        timestamp=utils.utcnow(),
+        fields=fields,
+        author__name=f"{member}",
+        author__url=member.avatar.url,
+        thumbnail__url=member.avatar.url,
+        footer__text=author.name,
+        footer__icon_url=author.avatar.url
+    )
 
 
 class Profile(ui.ExitableView):
@@ -74,13 +89,7 @@ class Profile(ui.ExitableView):
     
     async def get_embed(self, member: utils.discord.Member, banner: Optional[utils.discord.Asset]) -> utils.discord.Embed:
         if banner is None:
-            path = f"resource/img/default_banner_{member.id}.png"
-            default_banner = Image.new("RGB", (600, 240), member.colour.to_rgb())
-            default_banner = default_banner.save(path)
-            with open(path, "rb") as f:
-                banner = await utils.send_file_and_get_url(self.ctx.bot, utils.discord.File(fp=f))
-                
-            os.remove(path)
+            banner = await self.ctx.bot.banners.get_url(member.colour.to_rgb())
         else:
             banner = banner.url
         
@@ -112,7 +121,7 @@ class Profile(ui.ExitableView):
     @ui.button(label="Information", emoji="📑", style=utils.discord.ButtonStyle.secondary)
     @ui.change_color_when_used
     async def information(self, interaction: utils.discord.Interaction, button: utils.discord.ui.Button, translation):
-        embed = info_embed(self.member, interaction.user, translation)
+        embed = info_embed(self.member, interaction.user, translation, presences=interaction.client.intents.presences)
         await interaction.response.edit_message(embed=embed, view=self)
         
         
@@ -122,7 +131,46 @@ class User(utils.Cog):
         self.afks = {}
         
     async def cog_load(self):
-        self.afks = await self._get_afks()
+        self.mirror = None
+        if env.LIVE_MIRRORS:
+            self.afks = {}
+            self.mirror = self.bot.add_mirror(db.DocumentMirror("users/afks", self._apply_afks))
+            try:
+                await self.bot.warmup.run("afks", self.mirror.wait_ready(env.MIRROR_READY_TIMEOUT))
+            except asyncio.TimeoutError:
+                print("[-] Afks snapshot listener not ready, reading them once")
+                self.bot.remove_mirror(self.mirror)
+                self.mirror = None
+                
+        if self.mirror is None:
+            self.afks = await self.bot.warmup.run("afks", self._get_afks())
+            for user_id in self.afks:
+                self._watch_afk(int(user_id))
+        
+        metrics.gauges["oneki_afks_size"] = lambda: len(self.afks)
+            
+    async def cog_unload(self):
+        if self.mirror is not None:
+            self.bot.remove_mirror(self.mirror)
+            
+        self.bot.router.remove_handler(self.on_afk_message)
+        self.bot.router.remove_handler(self.on_afk_mention)
+        metrics.gauges.pop("oneki_afks_size", None)
+        
+    def _apply_afks(self, data: dict):
+        # afks set or removed by other processes (or the console), the local ones are already applied
+        for user_id in self.afks.keys() - data.keys():
+            del self.afks[user_id]
+            self.bot.router.unwatch_user(int(user_id))
+        
+        for user_id, value in data.items():
+            if user_id not in self.afks:
+                self._watch_afk(int(user_id))
+                
+            self.afks[user_id] = value
+        
+    def _watch_afk(self, user_id: int):
+        self.bot.router.watch_user(user_id, on_message=self.on_afk_message, on_mention=self.on_afk_mention)
         
     async def _get_afks(self):
         # user_id: dict(reason, time)
@@ -151,7 +199,7 @@ class User(utils.Cog):
     @utils.commands.hybrid_command()
     async def info(self, ctx: Context, member: Optional[utils.discord.Member] = None):
         member = member or ctx.author
-        embed = info_embed(member, ctx.author, ctx.translation)
+        embed = info_embed(member, ctx.author, ctx.translation, presences=ctx.bot.intents.presences)
         
         await ctx.send(embed=embed)
         
@@ -160,16 +208,14 @@ class User(utils.Cog):
     async def add_to_afk(self, user_id, *, reason):
         data = {"reason": reason, "time": utils.utcnow()}
         self.afks[str(user_id)] = data
+        self._watch_afk(user_id)
         
         doc_ref = self.bot.db.document("users/afks")
-        doc = await doc_ref.get()
-        if doc.exists:
-            await doc_ref.update({str(user_id): data})
-        else:
-            await doc_ref.set(self.afks)
+        await doc_ref.set({str(user_id): data}, merge=True)
 
     async def remove_from_afk(self, user_id):
-        self.afks.pop(str(user_id))
+        self.afks.pop(str(user_id), None)
+        self.bot.router.unwatch_user(user_id)
         
         doc_ref = self.bot.db.document("users/afks")
         await doc_ref.delete(str(user_id))
@@ -185,7 +231,7 @@ class User(utils.Cog):
                 await member.edit(nick=member.display_name.replace("[AFK] ", ""))
             except: pass
             
-            embed = utils.discord.Embed(title=translation.no_longer_afk.format(member.display_name), color=0xFCE64C)
+            embed = NO_LONGER_AFK_EMBEDS.get(translation).render(title=member.display_name)
             return await ctx.send(embed=embed)
             
         reason = reason or ctx.translation.no_reason
@@ -207,14 +253,13 @@ class User(utils.Cog):
                 
         await ctx.send(embed=embed)
     
-    @utils.Cog.listener()
-    async def on_message(self, message: utils.discord.Message):
-        # if the user is afk
+    # the router only calls these for users in self.afks
+    
+    async def on_afk_message(self, message: utils.discord.Message, info: utils.MessageInfo):
+        if info.command is self.afk: 
+            return 
+        
         if str(message.author.id) in self.afks:
-            ctx = await self.bot.get_context(message)
-            if ctx.valid and ctx.command == self.bot.get_command("afk"): 
-                return 
-            
             member = message.author
             translation = self.translations.event(self.bot.get_guild_lang(message.guild), "afk")
 
@@ -223,22 +268,24 @@ class User(utils.Cog):
                 await member.edit(nick=member.display_name.replace("[AFK] ", ""))
             except: pass
             
-            embed = utils.discord.Embed(title=translation.no_longer_afk.format(member.display_name), color=0xFCE64C)
+            embed = NO_LONGER_AFK_EMBEDS.get(translation).render(title=member.display_name)
             await message.channel.send(embed=embed, delete_after=10.0)
 
-        # is there a mention of an afk user?
-        if message.mentions:
-            translation = self.translations.event(self.bot.get_guild_lang(message.guild), "afk")
-            for user in message.mentions:
-                if str(user.id) in self.afks:
-                    data = self.afks[str(user.id)]
-                    embed = utils.discord.Embed(
-                        title=translation.embed.title.format(user.display_name),
-                        description=translation.embed.reason.format(data["reason"]),
-                        timestamp=data["time"],
-                        color=0xFCE64C
-                    )
-                    await message.channel.send(embed=embed, delete_after=15.0)
+    async def on_afk_mention(self, message: utils.discord.Message, info: utils.MessageInfo):
+        translation = self.translations.event(self.bot.get_guild_lang(message.guild), "afk")
+        template = AFK_EMBEDS.get(translation)
+        embeds = [
+            template.render(
+                title=user.display_name,
+                description=self.afks[str(user.id)]["reason"],
+                timestamp=self.afks[str(user.id)]["time"]
+            )
+            for user in info.watched_mentions if str(user.id) in self.afks
+        ]
+        
+        # one message per 10 embeds (the discord limit) instead of one per mentioned user
+        for i in range(0, len(embeds), 10):
+            await message.channel.send(embeds=embeds[i:i + 10], delete_after=15.0)
         
         
 async def setup(bot):
@@ -1,12 +1,36 @@
-import traceback
-import sys
+import hashlib
+import time
+import json
+import os
 
 import discord
 from discord import app_commands
 from utils.ui import ReportBug
+from utils.metrics import metrics
+from utils.logs import format_error
+from utils.costs import attribute
+
+
+def _command_name(data: dict) -> str:
+    """Qualified name of the invoked command, the subcommands are the first options"""
+    name, options = data.get("name", "unknown"), data.get("options", [])
+    while options and options[0].get("type") in (1, 2):  # subcommand, subcommand group
+        name = f"{name} {options[0]['name']}"
+        options = options[0].get("options", [])
+        
+    return name
 
 
 class CommandTree(app_commands.CommandTree):
+    async def _call(self, interaction: discord.Interaction) -> None:
+        start = time.perf_counter()
+        try:
+            with attribute(f"command:{_command_name(interaction.data or {})}", interaction.guild_id):
+                await super()._call(interaction)
+        finally:
+            if interaction.command is not None:
+                metrics.observe_command(interaction.command.qualified_name, time.perf_counter() - start)
+    
     async def on_error(self, interaction: discord.Interaction, error: app_commands.AppCommandError) -> None:
         err = getattr(error, "original", error)
         if isinstance(err, app_commands.CommandNotFound): 
@@ -17,7 +41,49 @@ class CommandTree(app_commands.CommandTree):
         else:
             await interaction.response.send_message(f"{err.__class__.__name__}: {err}")
 
-        print(f"In {interaction.command.qualified_name}:", file=sys.stderr)
-        traceback.print_tb(err.__traceback__)
-        print(f"{err.__class__.__name__}: {err}", file=sys.stderr)
+        interaction.client.logs.push(format_error(f"In {interaction.command.qualified_name}:", err))
+
+    async def get_hash(self) -> str:
+        """Stable hash of the global commands payload sent by sync()"""
+        # built like sync() builds it, translations included
+        commands = self._get_all_commands()
+        translator = self.translator
+        if translator:
+            payload = [await command.get_translated_payload(self, translator) for command in commands]
+        else:
+            payload = [command.to_dict(self) for command in commands]
+        
+        # the cogs load concurrently, the order the commands are added in changes between boots
+        payload.sort(key=lambda command: (command.get("type", 1), command["name"]))
+        return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+    async def sync_if_changed(self, *, path: str, force: bool = False) -> bool:
+        """Syncs only when the commands changed since the last sync of this application, returns whether it synced"""
+        hashes = {}
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                try:
+                    hashes = json.loads(f.read())
+                except ValueError:
+                    # a corrupted file only costs a sync
+                    print(f"[-] {path} can't be parsed, syncing the commands")
+            
+            if not isinstance(hashes, dict):
+                hashes = {}
+        
+        application_id = str(self.client.application_id)
+        current = await self.get_hash()
+        if not force and hashes.get(application_id) == current:
+            return False
+        
+        await self.sync()
+        
+        hashes[application_id] = current
+        # replaced at once, a crash while writing leaves the previous file
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            f.write(json.dumps(hashes))
         
+        os.replace(tmp, path)
+            
+        return True
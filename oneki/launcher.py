@@ -0,0 +1,50 @@
+import multiprocessing
+import os
+import sys
+
+from utils import env, translations
+
+
+def _run_cluster(cluster_id: int, shard_ids: list[int], shard_count: int):
+    os.makedirs(env.LOG_DIR, exist_ok=True)
+    log = open(os.path.join(env.LOG_DIR, f"cluster-{cluster_id}.log"), "a", buffering=1)
+    sys.stdout = sys.stderr = log
+
+    from bot import OnekiBot
+
+    print(f"[+] Cluster {cluster_id}: shards {shard_ids[0]}-{shard_ids[-1]} of {shard_count}")
+    bot = OnekiBot(shard_ids=shard_ids, shard_count=shard_count, cluster_id=cluster_id)
+    bot.run()
+
+
+def split_shards(shard_count: int, cluster_count: int) -> list[list[int]]:
+    """Splits the shards in contiguous ranges, the first clusters take the remainder"""
+    size, remainder = divmod(shard_count, cluster_count)
+    clusters, start = [], 0
+    for cluster_id in range(cluster_count):
+        end = start + size + (1 if cluster_id < remainder else 0)
+        clusters.append(list(range(start, end)))
+        start = end
+
+    return clusters
+
+
+def launch(cluster_count: int, *, shard_count: int):
+    if shard_count < cluster_count:
+        raise ValueError(f"can't split {shard_count} shards in {cluster_count} clusters")
+
+    # built once here, not by every cluster at the same time
+    translations.build_if_stale(bundle_path=env.TRANSLATIONS_BUNDLE_PATH)
+    
+    # spawn, the firestore grpc channels are not fork safe
+    ctx = multiprocessing.get_context("spawn")
+    processes = []
+    for cluster_id, shard_ids in enumerate(split_shards(shard_count, cluster_count)):
+        process = ctx.Process(target=_run_cluster, args=(cluster_id, shard_ids, shard_count), name=f"cluster-{cluster_id}")
+        process.start()
+        processes.append(process)
+
+    for process in processes:
+        process.join()
+        if process.exitcode != 0:
+            print(f"{process.name} exited with code {process.exitcode}", file=sys.stderr)
@@ -9,6 +9,7 @@ import random
 import re
 
 from .cog import Cog
+from .router import MessageInfo
 
 
 utcnow = discord.utils.utcnow
@@ -25,7 +26,7 @@ def filled_bar(current: int, *, len = 25) -> str:
     return "".join(["█" for _ in range(0, progress)]) + "".join([" " for _ in range(0, len - progress)])
 
 async def send_file_and_get_url(bot, file: discord.File):
-    channel = await bot.fetch_channel(885674115946643456)
+    channel = bot.get_channel(885674115946643456) or await bot.fetch_channel(885674115946643456)
     message = await channel.send(file=file) 
     return message.attachments[0]
     
\ No newline at end of file
@@ -0,0 +1,214 @@
+import asyncio
+import json
+import os
+import time
+
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable, Optional
+
+
+_MISSING = object()
+
+
+class LRUCache:
+    """A size bounded mapping that evicts the least recently used entries, entries can also expire after `ttl` seconds"""
+    def __init__(self, maxsize: int = 1024, *, ttl: Optional[float] = None) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: OrderedDict[Hashable, tuple[Any, Optional[float]]] = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _lookup(self, key: Hashable) -> Any:
+        try:
+            value, expires_at = self._entries[key]
+        except KeyError:
+            return _MISSING
+
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self._entries[key]
+            return _MISSING
+
+        self._entries.move_to_end(key)
+        return value
+
+    def peek(self, key: Hashable, default: Any = None) -> Any:
+        """Returns the cached value without touching the counters"""
+        value = self._lookup(key)
+        return default if value is _MISSING else value
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        value = self._lookup(key)
+        if value is _MISSING:
+            self.misses += 1
+            return default
+
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+        self._entries[key] = (value, expires_at)
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        value, _ = self._entries.pop(key, (default, None))
+        return value
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    @property
+    def stats(self) -> dict[str, int]:
+        return {"size": len(self), "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self._lookup(key) is not _MISSING
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def _retrieve(task: asyncio.Task) -> None:
+    # the waiters receive the exception, avoid the "never retrieved" warning when they were all cancelled
+    if not task.cancelled():
+        task.exception()
+
+
+class AsyncLRUCache(LRUCache):
+    """A `LRUCache` that loads missing entries with `loader`, concurrent misses of the same key share one load
+
+    The load runs in its own task, a caller cancelled while waiting doesn't cancel it for the
+    others. The callers that join a running load are counted as `joins`, not as misses.
+    """
+    def __init__(self, loader: Callable[[Hashable], Awaitable[Any]], maxsize: int = 1024, *, ttl: Optional[float] = None) -> None:
+        super().__init__(maxsize, ttl=ttl)
+        self._loader = loader
+        self._pending: dict[Hashable, asyncio.Task] = {}
+        self.joins = 0
+
+    async def fetch(self, key: Hashable) -> Any:
+        value = self._lookup(key)
+        if value is not _MISSING:
+            self.hits += 1
+            return value
+
+        task = self._pending.get(key)
+        if task is not None:
+            self.joins += 1
+        else:
+            self.misses += 1
+            task = self._pending[key] = asyncio.create_task(self._load(key))
+            task.add_done_callback(_retrieve)
+
+        return await asyncio.shield(task)
+
+    async def _load(self, key: Hashable) -> Any:
+        task = asyncio.current_task()
+        try:
+            value = await self._loader(key)
+            # an invalidation during the load means the value may be stale, don't keep it
+            if self._pending.get(key) is task:
+                self.set(key, value)
+
+            return value
+        finally:
+            if self._pending.get(key) is task:
+                del self._pending[key]
+
+    def invalidate(self, key: Hashable) -> None:
+        """Drops the entry and detaches the running load of the key, the next fetch loads it again"""
+        self.pop(key)
+        self._pending.pop(key, None)
+
+    @property
+    def stats(self) -> dict[str, int]:
+        return {**super().stats, "joins": self.joins}
+
+
+class SingleFlight:
+    """Concurrent runs with the same key share the first one, nothing is kept once it finishes
+
+    Like `AsyncLRUCache.fetch`, the shared run is a task of its own.
+    """
+    def __init__(self) -> None:
+        self._pending: dict[Hashable, asyncio.Task] = {}
+
+    async def run(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._pending.get(key)
+        if task is None:
+            task = self._pending[key] = asyncio.create_task(self._run(key, func))
+            task.add_done_callback(_retrieve)
+
+        return await asyncio.shield(task)
+
+    async def _run(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        task = asyncio.current_task()
+        try:
+            return await func()
+        finally:
+            if self._pending.get(key) is task:
+                del self._pending[key]
+
+    def forget(self, key: Hashable) -> None:
+        """The next run of the key starts again instead of joining the running one"""
+        self._pending.pop(key, None)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._pending
+
+
+class PersistentAsyncLRUCache(AsyncLRUCache):
+    """An `AsyncLRUCache` of json values saved to `path` on every change, so it survives restarts
+
+    The expiry of the entries is saved as a wall clock time, an entry expired while the bot
+    was down is not loaded.
+    """
+    def __init__(self, loader: Callable[[str], Awaitable[Any]], path: str, maxsize: int = 1024, *, ttl: Optional[float] = None) -> None:
+        super().__init__(loader, maxsize, ttl=ttl)
+        self.path = path
+
+        if os.path.exists(path):
+            now, monotonic = time.time(), time.monotonic()
+            with open(path, "r") as f:
+                for entry in json.loads(f.read())[-maxsize:]:
+                    # [key, value, expires_at or None], the entries saved without expiry are dropped when there is a ttl
+                    if len(entry) != 3 and ttl is not None:
+                        continue
+
+                    key, value, expires_at = entry if len(entry) == 3 else (*entry, None)
+                    if expires_at is not None:
+                        if expires_at <= now:
+                            continue
+
+                        expires_at = monotonic + (expires_at - now)
+
+                    self._entries[key] = (value, expires_at)
+
+    def set(self, key: str, value: Any) -> None:
+        super().set(key, value)
+        self._save()
+
+    def _save(self) -> None:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        now, monotonic = time.time(), time.monotonic()
+        entries = [
+            [key, value, now + (expires_at - monotonic) if expires_at is not None else None]
+            for key, (value, expires_at) in self._entries.items()
+        ]
+
+        # replaced at once, the other processes of the cluster may be reading it
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            f.write(json.dumps(entries))
+
+        os.replace(tmp, self.path)
@@ -34,7 +34,7 @@ class Context(commands.Context):
     async def log(self, message):
         timestamp = datetime.datetime.utcnow()
 
-        print(f"log: \n{message}\ncommand: {self.command}\ntimestamp: {timestamp}")
-        await self.debug_channel.send(f"log: \n`{message}`\ncommand: `{self.command}`\ntimestamp: `{timestamp}`")
+        # batched by the bot, the command never waits on the debug channel
+        self.bot.logs.push(f"log: \n{message}\ncommand: {self.command}\ntimestamp: {timestamp}")
         
     
\ No newline at end of file
@@ -0,0 +1,106 @@
+import contextlib
+import contextvars
+
+from collections import defaultdict
+from typing import Optional
+
+
+# the operations that read documents, the rest write them
+READS = frozenset(("get", "query", "get_all", "list"))
+
+
+class Operation:
+    """What caused the firestore calls made in this context, a command, a message handler or an event"""
+    __slots__ = ("name", "guild_id")
+
+    def __init__(self, name: str, guild_id: Optional[int] = None) -> None:
+        self.name = name
+        self.guild_id = guild_id
+
+
+current_operation: contextvars.ContextVar[Optional[Operation]] = contextvars.ContextVar("current_operation", default=None)
+
+
+@contextlib.contextmanager
+def attribute(name: str, guild_id: Optional[int] = None):
+    """The firestore calls made inside (and in the tasks created inside) are charged to `name` and the guild"""
+    token = current_operation.set(Operation(name, guild_id))
+    try:
+        yield
+    finally:
+        current_operation.reset(token)
+
+
+class Cost:
+    __slots__ = ("calls", "reads", "writes", "elapsed")
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.reads = 0
+        self.writes = 0
+        self.elapsed = 0.0
+
+    def add(self, op: str, elapsed: float, documents: int) -> None:
+        self.calls += 1
+        self.elapsed += elapsed
+        if op in READS:
+            self.reads += documents
+        else:
+            self.writes += documents
+
+    def to_dict(self) -> dict:
+        return {
+            "calls": self.calls,
+            "reads": self.reads,
+            "writes": self.writes,
+            "avg_ms": round(self.elapsed / self.calls * 1000, 2) if self.calls else 0.0
+        }
+
+
+class CostLedger:
+    """Firestore calls, documents billed and latency per operation (and firestore op) and per guild"""
+    def __init__(self) -> None:
+        # (operation, firestore op): cost
+        self.operations: defaultdict[tuple[str, str], Cost] = defaultdict(Cost)
+        self.guilds: defaultdict[Optional[int], Cost] = defaultdict(Cost)
+
+    def observe(self, op: str, elapsed: float, documents: int) -> None:
+        operation = current_operation.get()
+        name, guild_id = (operation.name, operation.guild_id) if operation is not None else ("unattributed", None)
+
+        self.operations[(name, op)].add(op, elapsed, documents)
+        self.guilds[guild_id].add(op, elapsed, documents)
+
+    def to_dict(self) -> dict:
+        return {
+            "operations": [
+                {"operation": name, "op": op, **cost.to_dict()}
+                for (name, op), cost in sorted(self.operations.items())
+            ],
+            "guilds": [
+                {"guild_id": guild_id, **cost.to_dict()}
+                for guild_id, cost in sorted(self.guilds.items(), key=lambda item: -(item[1].reads + item[1].writes))
+            ]
+        }
+
+    def report(self, limit: int = 10) -> str:
+        """The operations and guilds that cost the most documents"""
+        totals: defaultdict[str, Cost] = defaultdict(Cost)
+        for (name, _), cost in self.operations.items():
+            total = totals[name]
+            total.calls += cost.calls
+            total.reads += cost.reads
+            total.writes += cost.writes
+            total.elapsed += cost.elapsed
+
+        def lines(title: str, costs: dict) -> list[str]:
+            rows = sorted(costs.items(), key=lambda item: -(item[1].reads + item[1].writes))[:limit]
+            return [f"{title:<40} {'calls':>7} {'reads':>7} {'writes':>7} {'avg':>9}"] + [
+                f"{str(key)[:40]:<40} {cost.calls:>7} {cost.reads:>7} {cost.writes:>7} {cost.to_dict()['avg_ms']:>7.1f}ms"
+                for key, cost in rows
+            ]
+
+        return "\n".join(lines("operation", totals) + [""] + lines("guild", self.guilds))
+
+
+ledger = CostLedger()
@@ -1,16 +1,57 @@
 from firebase_admin import credentials, firestore
 import firebase_admin
+import asyncio
+import contextlib
+import itertools
+import random
+import time
 
 from utils import env
+from utils.cache import AsyncLRUCache, SingleFlight
+from utils.costs import attribute, ledger
+from google.api_core import exceptions, gapic_v1
+from utils.profiler import record
+from utils.metrics import metrics
 from json import loads
+from collections import Counter
+from typing import Awaitable, Callable, Optional
 
 
-cred = credentials.Certificate(loads(env.GOOGLE_APPLICATION_CREDENTIALS))
-firebase_app = firebase_admin.initialize_app(cred)
+_firebase_app = None
+
+
+def firebase_app():
+    """Initialized on first use, the sqlite backend runs without firebase credentials"""
+    global _firebase_app
+    if _firebase_app is None:
+        cred = credentials.Certificate(loads(env.GOOGLE_APPLICATION_CREDENTIALS))
+        _firebase_app = firebase_admin.initialize_app(cred)
+        
+    return _firebase_app
+
+
+# errors worth retrying, the writes only on the ones where the write surely was not applied
+RETRYABLE_READ = (
+    exceptions.ResourceExhausted, exceptions.ServiceUnavailable, exceptions.DeadlineExceeded, 
+    exceptions.InternalServerError, exceptions.Aborted
+)
+RETRYABLE_WRITE = (exceptions.ResourceExhausted, exceptions.ServiceUnavailable, exceptions.Aborted)
+BACKOFF_BASE = 0.1
+BACKOFF_CAP = 10.0
+# AsyncQuery.stream options and their defaults
+STREAM_DEFAULTS = {"transaction": None, "retry": gapic_v1.method.DEFAULT, "timeout": None, "explain_options": None, "read_time": None}
+_NO_DEFAULT = object()
+
+
+def _record(op: str) -> None:
+    """Counts one RPC into the active startup phase and the metrics, documents read are counted apart"""
+    record("firestore")
+    metrics.firestore[op] += 1
 
 
 def async_client(app=None):
-    """Returns a client that can be used to interact with Google Cloud Firestore.
+    """Returns a client that can be used to interact with Google Cloud Firestore,
+    or the embedded sqlite storage when DB_BACKEND is "sqlite".
 
     Args:
       app: An App instance (optional).
@@ -22,18 +63,111 @@ def async_client(app=None):
       ValueError: If a project ID is not specified either via options, credentials or
           environment variables, or if the specified project ID is not a valid string.
     """
-    fs_client: _FirestoreAsyncClient = firestore._utils.get_app_service(app, firestore._FIRESTORE_ATTRIBUTE, _FirestoreAsyncClient.from_app)
+    if env.DB_BACKEND == "sqlite":
+        from utils.sqlite import SQLiteClient
+        return SQLiteClient(env.SQLITE_PATH)
+    
+    fs_client: _FirestoreAsyncClient = firestore._utils.get_app_service(app or firebase_app(), firestore._FIRESTORE_ATTRIBUTE, _FirestoreAsyncClient.from_app)
     return fs_client.get()
 
 
 class AsyncDocumentReference(firestore.firestore.AsyncDocumentReference):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        
+    async def get(self, *args, **kwargs):
+        # only plain reads go through the cache, not field masks or transactions
+        cache = self._client.cache
+        if cache is None or args or kwargs:
+            return await self._get(*args, **kwargs)
+        
+        return await cache.fetch(self.path)
+    
+    async def _get(self, *args, **kwargs):
+        get = super().get
+        
+        async def fetch():
+            _record("get")
+            metrics.firestore["read"] += 1
+            return await get(*args, **kwargs)
+        
+        if args or kwargs:
+            return await self._client.call("get", fetch)
+        
+        return await self._client.single_flight("get", ("get", self.path), fetch)
+    
+    async def set(self, *args, **kwargs):
+        _record("write")
+        write = super().set
+        try:
+            return await self._client.call("write", lambda: write(*args, **kwargs), retryable=RETRYABLE_WRITE)
+        finally:
+            self._client.invalidate(self.path)
+    
+    async def update(self, *args, **kwargs):
+        _record("write")
+        write = super().update
+        try:
+            return await self._client.call("write", lambda: write(*args, **kwargs), retryable=RETRYABLE_WRITE)
+        finally:
+            self._client.invalidate(self.path)
     
     async def delete(self, camp=None, *args):
+        _record("write")
+        update, delete = super().update, super().delete
         if camp is not None:
-            await super().update({camp: firestore.firestore.DELETE_FIELD}, *args) 
-        else: await super().delete(*args)
+            write = lambda: update({camp: firestore.firestore.DELETE_FIELD}, *args)
+        else:
+            write = lambda: delete(*args)
+            
+        try:
+            await self._client.call("write", write, retryable=RETRYABLE_WRITE)
+        finally:
+            self._client.invalidate(self.path)
+
+
+class AsyncQuery(firestore.firestore.AsyncQuery):
+    async def stream(self, *args, **kwargs):
+        stream = super().stream
+        
+        async def fetch():
+            _record("query")
+            docs = [doc async for doc in stream(*args, **kwargs)]
+            metrics.firestore["read"] += len(docs)
+            return docs
+        
+        # the results are fetched at once, so identical queries running together can share them
+        client = self._parent._client
+        # the collection references pass the default options as keywords, they don't change the results
+        options = {key: value for key, value in kwargs.items() if value is not STREAM_DEFAULTS.get(key, _NO_DEFAULT)}
+        if args or options:
+            docs = await client.call("query", fetch)
+        else:
+            structured_query = self._to_protobuf()
+            key = ("query", self._parent._path, type(structured_query).serialize(structured_query))
+            docs = await client.single_flight("query", key, fetch)
+        
+        for doc in docs:
+            yield doc
+
+
+class AsyncCollectionReference(firestore.firestore.AsyncCollectionReference):
+    def _query(self) -> AsyncQuery:
+        return AsyncQuery(self)
+    
+    async def list_documents(self, *args, **kwargs):
+        _record("list")
+        # lazy, the explorer pages it between interactions, so only the waits for the next reference are timed
+        iterator = super().list_documents(*args, **kwargs).__aiter__()
+        while True:
+            start = time.perf_counter()
+            try:
+                doc_ref = await iterator.__anext__()
+            except StopAsyncIteration:
+                return
+            
+            ledger.observe("list", time.perf_counter() - start, 1)
+            yield doc_ref
 
 
 class AsyncClient(firestore.firestore.AsyncClient):
@@ -44,12 +178,532 @@ class AsyncClient(firestore.firestore.AsyncClient):
         self.ArrayUnion = firestore.firestore.ArrayUnion
         self.ArrayRemove = firestore.firestore.ArrayRemove
         self.Increment = firestore.firestore.Increment
-        self.Query = firestore.firestore.AsyncQuery
+        self.DELETE_FIELD = firestore.firestore.DELETE_FIELD
+        self.Query = AsyncQuery
+        self.cache: Optional[AsyncLRUCache] = None
+        
+        self.max_concurrency = env.FIRESTORE_CONCURRENCY
+        self.max_retries = env.FIRESTORE_MAX_RETRIES
+        self._slots = asyncio.Semaphore(self.max_concurrency)
+        self._flights = SingleFlight()
+        # callers waiting for a slot, and the ones holding one
+        self.queued = 0
+        self.in_flight = 0
+    
+    def enable_cache(self, maxsize: int, *, ttl: float) -> None:
+        """Read-through cache of `AsyncDocumentReference.get`, the writes made through this client invalidate their entry
+        
+        The writes made by other processes (other clusters included) are seen after `ttl` seconds at most.
+        """
+        self.cache = AsyncLRUCache(lambda path: self.document(path)._get(), maxsize, ttl=ttl)
+    
+    def invalidate(self, path: str) -> None:
+        # a read started before the write doesn't see it, the next ones don't join it
+        self._flights.forget(("get", path))
+        if self.cache is not None:
+            self.cache.invalidate(path)
     
     def document(self, *document_path: str) -> AsyncDocumentReference:
         return AsyncDocumentReference(
             *self._document_path_helper(*document_path), client=self
         )
+    
+    def collection(self, *collection_path: str) -> AsyncCollectionReference:
+        return AsyncCollectionReference(
+            *super().collection(*collection_path)._path, client=self
+        )
+    
+    async def get_all(self, references, *args, **kwargs):
+        get_all = super().get_all
+        
+        async def fetch():
+            _record("get_all")
+            docs = [doc async for doc in get_all(references, *args, **kwargs)]
+            metrics.firestore["read"] += len(docs)
+            return docs
+        
+        for doc in await self.call("get_all", fetch):
+            yield doc
+    
+    async def call(self, op: str, func: Callable[[], Awaitable], *, retryable: tuple = RETRYABLE_READ, documents: int = 1):
+        """Runs `func` when one of the `max_concurrency` slots is free, retrying the retryable errors
+        
+        The retries wait a random time up to BACKOFF_BASE * 2^attempt seconds (capped at
+        BACKOFF_CAP), so the callers hitting a quota error together don't retry together,
+        and take a slot again after the wait. The successful attempt is charged to the
+        current operation with its latency and `documents`, or the number of documents
+        returned (a query costs one read when empty).
+        """
+        for attempt in itertools.count():
+            self.queued += 1
+            try:
+                await self._slots.acquire()
+            finally:
+                self.queued -= 1
+            
+            self.in_flight += 1
+            start = time.perf_counter()
+            try:
+                result = await func()
+            except retryable:
+                if attempt >= self.max_retries:
+                    raise
+                
+                metrics.firestore_retries[op] += 1
+            else:
+                ledger.observe(op, time.perf_counter() - start, max(1, len(result)) if isinstance(result, list) else documents)
+                return result
+            finally:
+                self.in_flight -= 1
+                self._slots.release()
+            
+            # without the slot, the other calls run while this one backs off
+            await asyncio.sleep(random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt)))
+    
+    async def single_flight(self, op: str, key, func: Callable[[], Awaitable]):
+        """`call`, but the identical reads running at the same time share one"""
+        if key in self._flights:
+            metrics.firestore_shared[op] += 1
+            
+        return await self._flights.run(key, lambda: self.call(op, func))
+
+
+BATCH_LIMIT = 500  # writes per WriteBatch
+_CONFLICT = object()
+
+
+def _combine(old, value):
+    """The value written in place of `old` then `value`, or `_CONFLICT` when both can't be merged"""
+    transforms = firestore.firestore
+    if isinstance(value, transforms.Increment):
+        if isinstance(old, transforms.Increment):
+            return transforms.Increment(old.value + value.value)
+        
+        if isinstance(old, (int, float)) and not isinstance(old, bool):
+            return old + value.value
+        
+        return _CONFLICT
+    
+    for array_transform in (transforms.ArrayUnion, transforms.ArrayRemove):
+        if isinstance(value, array_transform):
+            if isinstance(old, array_transform):
+                return array_transform(list(old.values) + list(value.values))
+            
+            return _CONFLICT
+    
+    # a plain value (or DELETE_FIELD) replaces whatever was pending
+    return value
+
+
+def _unflatten(fields: dict) -> dict:
+    """{"a.b": 1} -> {"a": {"b": 1}}, set(merge=[...]) takes nested data"""
+    data = {}
+    for key, value in fields.items():
+        *parents, name = key.split(".")
+        node = data
+        for parent in parents:
+            node = node.setdefault(parent, {})
+            
+        node[name] = value
+        
+    return data
+
+
+class _PendingDocument:
+    __slots__ = ("segments", "since")
+    
+    def __init__(self) -> None:
+        # field path: value, each segment is one write, a new one starts when a field can't be merged
+        self.segments: list[dict] = [{}]
+        self.since = time.monotonic()
+        
+    def merge(self, data: dict) -> None:
+        fields = self.segments[-1]
+        for key, value in data.items():
+            if any(key.startswith(f"{pending}.") for pending in fields):
+                # a child of a pending field, written after it
+                fields = {}
+                self.segments.append(fields)
+            else:
+                # the field replaces its pending children
+                for child in [pending for pending in fields if pending.startswith(f"{key}.")]:
+                    del fields[child]
+            
+            if key in fields:
+                combined = _combine(fields[key], value)
+                if combined is _CONFLICT:
+                    fields = {}
+                    self.segments.append(fields)
+                else:
+                    value = combined
+                    
+            fields[key] = value
+
+
+class WriteBehind:
+    """Opt-in write-behind buffer, updates to the same document are merged and committed in WriteBatches
+    
+    `update` takes field paths like `AsyncDocumentReference.update`, but creates the document
+    when missing. The pending writes are committed when `max_pending` writes are waiting or
+    `max_delay` seconds after the oldest one, so while firestore accepts the commits a crash
+    loses at most `max_delay` seconds of writes. Failed commits are retried on the next flush.
+    Documents written directly (or deleted) go through `direct`, so no buffered write lands after.
+    """
+    def __init__(self, client: AsyncClient, *, max_pending: int = BATCH_LIMIT, max_delay: float = 2.0) -> None:
+        self.client = client
+        self.max_pending = max_pending
+        self.max_delay = max_delay
+        
+        self._pending: dict[str, _PendingDocument] = {}
+        # paths written directly right now, their buffered writes are dropped
+        self._tombstones: Counter[str] = Counter()
+        self._size = 0
+        self._wake = asyncio.Event()
+        self._full = asyncio.Event()
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        
+    def update(self, path: str, data: dict) -> None:
+        if path in self._tombstones:
+            return
+        
+        document = self._pending.get(path)
+        if document is None:
+            document = self._pending[path] = _PendingDocument()
+            self._size += 1
+        
+        self._size -= len(document.segments)
+        document.merge(data)
+        self._size += len(document.segments)
+        
+        self._wake.set()
+        if self._size >= self.max_pending:
+            self._full.set()
+    
+    def discard(self, path: str) -> None:
+        """Drops the pending writes of a document"""
+        document = self._pending.pop(path, None)
+        if document is not None:
+            self._size -= len(document.segments)
+            
+    @contextlib.asynccontextmanager
+    async def direct(self, path: str):
+        """Wraps a direct write (or delete) of a document: its pending writes are dropped, a running
+        flush is waited for and the updates made until the write finishes are dropped
+        """
+        self._tombstones[path] += 1
+        try:
+            self.discard(path)
+            # a flush may hold the writes taken before, they must land before the direct write
+            async with self._lock:
+                pass
+            
+            yield
+        finally:
+            self._tombstones[path] -= 1
+            if not self._tombstones[path]:
+                del self._tombstones[path]
+    
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+        
+    async def _run(self) -> None:
+        while True:
+            await self._wake.wait()
+            if self._pending:
+                oldest = min(document.since for document in self._pending.values())
+                delay = oldest + self.max_delay - time.monotonic()
+                if delay > 0 and self._size < self.max_pending:
+                    try:
+                        await asyncio.wait_for(self._full.wait(), delay)
+                    except asyncio.TimeoutError:
+                        pass
+                    
+            if not await self.flush():
+                await asyncio.sleep(self.max_delay)
+            
+    async def flush(self) -> bool:
+        """Commits every pending write, returns False when a commit failed and its writes were requeued"""
+        async with self._lock:
+            pending, self._pending, self._size = self._pending, {}, 0
+            self._wake.clear()
+            self._full.clear()
+            
+            writes = [
+                (path, fields, document.since) 
+                for path, document in pending.items() if path not in self._tombstones
+                for fields in document.segments if fields
+            ]
+            for i in range(0, len(writes), BATCH_LIMIT):
+                chunk = writes[i:i + BATCH_LIMIT]
+                batch = self.client.batch()
+                for path, fields, _ in chunk:
+                    batch.set(self.client.document(path), _unflatten(fields), merge=list(fields))
+                
+                try:
+                    _record("commit")
+                    with attribute("write_behind"):
+                        await self.client.call("commit", batch.commit, retryable=RETRYABLE_WRITE, documents=len(chunk))
+                except Exception as e:
+                    print(f"[-] Write-behind commit failed, {len(writes) - i} writes requeued: {e.__class__.__name__}: {e}")
+                    self._requeue(writes[i:])
+                    return False
+                
+                metrics.firestore["write"] += len(chunk)
+                now = time.monotonic()
+                for path, _, since in chunk:
+                    self.client.invalidate(path)
+                    metrics.observe_write_lag(path.split("/", 1)[0], now - since)
+                    
+            return True
+    
+    def _requeue(self, writes: list[tuple[str, dict, float]]) -> None:
+        newer, self._pending = self._pending, {}
+        for path, fields, since in writes:
+            if path in self._tombstones:
+                continue
+            
+            document = self._pending.get(path)
+            if document is None:
+                document = self._pending[path] = _PendingDocument()
+                document.segments.clear()
+                document.since = since
+                
+            document.segments.append(fields)
+        
+        # the writes received during the commit go after the failed ones
+        for path, document in newer.items():
+            if path in self._pending:
+                self._pending[path].segments.extend(document.segments)
+            else:
+                self._pending[path] = document
+        
+        self._size = sum(len(document.segments) for document in self._pending.values())
+        self._wake.set()
+            
+    async def close(self) -> None:
+        if self._task is not None:
+            # waits for a running flush, the task is cancelled between flushes
+            async with self._lock:
+                self._task.cancel()
+            
+        await self.flush()
+    
+    def __contains__(self, path: str) -> bool:
+        return path in self._pending
+    
+    def __len__(self) -> int:
+        return self._size
+
+
+def _add(totals: dict, data: dict) -> None:
+    """Adds the numbers of `data` (nested maps included) into `totals`"""
+    for key, value in data.items():
+        if isinstance(value, dict):
+            _add(totals.setdefault(key, {}), value)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            totals[key] = totals.get(key, 0) + value
+
+
+class ShardedCounter:
+    """Counters of a document spread over `shards` documents, `{path}/shards/{n}`, summed when read
+    
+    A document sustains about one write per second, each shard adds that much. The increments
+    go through the write-behind, a shard is kept while its write is pending so the buffer
+    still merges them. The sums are cached and the local increments applied to them, the
+    ones of other processes are seen after `ttl`. The fields of the document itself (counted
+    before the sharding) are part of the sums.
+    """
+    def __init__(self, client: AsyncClient, writes: WriteBehind, *, shards: int = 10, maxsize: int = 1024, ttl: Optional[float] = 60) -> None:
+        self.client = client
+        self.writes = writes
+        self.shards = shards
+        self.cache = AsyncLRUCache(self._load, maxsize, ttl=ttl)
+        self._current: dict[str, str] = {}
+        
+    def _shard(self, path: str) -> str:
+        shard = self._current.get(path)
+        if shard is None or shard not in self.writes:
+            shard = self._current[path] = f"{path}/shards/{random.randrange(self.shards)}"
+            
+        return shard
+        
+    def increment(self, path: str, field: str, amount: int = 1) -> None:
+        """`field` is a field path, like in `update`"""
+        self.writes.update(self._shard(path), {field: self.client.Increment(amount)})
+        
+        totals = self.cache.peek(path)
+        if totals is not None:
+            *parents, name = field.split(".")
+            for parent in parents:
+                totals = totals.setdefault(parent, {})
+                
+            totals[name] = totals.get(name, 0) + amount
+        else:
+            # a load running now may miss this increment, don't keep its result
+            self.cache.invalidate(path)
+            
+    async def get(self, path: str) -> dict:
+        """The sums of the counters of the document, the shards and the document itself"""
+        return await self.cache.fetch(path)
+    
+    async def _load(self, path: str) -> dict:
+        async def get_shards():
+            return [shard async for shard in self.client.collection(f"{path}/shards").stream()]
+        
+        doc, shards = await asyncio.gather(self.client.document(path).get(), get_shards())
+        
+        totals = {}
+        for data in itertools.chain([doc.to_dict() or {}], (shard.to_dict() or {} for shard in shards)):
+            _add(totals, data)
+            
+        return totals
+
+
+class _Mirror:
+    """Base of the snapshot listener mirrors, the listener runs in a background thread of the sync client
+    
+    A listener closed by a non retryable error is replaced every `check_interval` seconds,
+    the first snapshot of the new one carries the whole state so the mirror resyncs from it.
+    """
+    check_interval = 30.0
+    
+    def __init__(self, path: str, apply: Callable) -> None:
+        self.path = path
+        self.apply = apply
+        
+        self._ready = asyncio.Event()
+        self._closed = False
+        self._resync = False
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._watch = None
+        self._task: Optional[asyncio.Task] = None
+        
+    def _reference(self):
+        raise NotImplementedError
+        
+    def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._subscribe()
+        self._task = asyncio.create_task(self._supervise())
+    
+    async def wait_ready(self, timeout: Optional[float] = None) -> None:
+        """Waits for the first snapshot, raises asyncio.TimeoutError after `timeout` seconds
+        
+        A listener failing before its first snapshot (permissions, credentials, network) is
+        only replaced by `_supervise`, it never raises.
+        """
+        await asyncio.wait_for(self._ready.wait(), timeout)
+    
+    def _subscribe(self) -> None:
+        metrics.firestore["listen"] += 1
+        self._resync = True
+        self._watch = self._reference().on_snapshot(self._on_snapshot)
+    
+    def _on_snapshot(self, documents, changes, read_time) -> None:
+        # listener thread, the data is handed to the event loop
+        resync, self._resync = self._resync, False
+        self._loop.call_soon_threadsafe(self._push, self._extract(documents, changes, resync), resync)
+        
+    def _push(self, data: dict, resync: bool) -> None:
+        if self._closed:
+            # a snapshot handed over before closing
+            return
+        
+        metrics.firestore["snapshot"] += 1
+        try:
+            self._apply(data, resync)
+        except Exception as e:
+            print(f"[-] Snapshot of {self.path} not applied: {e.__class__.__name__}: {e}")
+        
+        self._ready.set()
+    
+    def _extract(self, documents, changes, resync: bool):
+        raise NotImplementedError
+    
+    def _apply(self, data, resync: bool) -> None:
+        raise NotImplementedError
+    
+    async def _supervise(self) -> None:
+        while True:
+            await asyncio.sleep(self.check_interval)
+            if not self._watch.is_active:
+                print(f"[-] Snapshot listener of {self.path} closed, subscribing again")
+                self._watch.unsubscribe()
+                self._subscribe()
+                
+    def close(self) -> None:
+        self._closed = True
+        if self._task is not None:
+            self._task.cancel()
+            
+        if self._watch is not None:
+            self._watch.unsubscribe()
+
+
+class DocumentMirror(_Mirror):
+    """Calls `apply(data)` with the whole data of the document ({} when missing) every time it changes"""
+    def _reference(self):
+        return _sync_client().document(self.path)
+    
+    def _extract(self, documents, changes, resync: bool) -> dict:
+        return (documents[0].to_dict() or {}) if documents else {}
+    
+    def _apply(self, data: dict, resync: bool) -> None:
+        self.apply(data)
+        
+
+class CollectionMirror(_Mirror):
+    """Calls `apply(changes)` with {document id: data or None when removed} for the documents changed in the collection
+    
+    The first snapshot after (re)subscribing lists every document, the ones removed meanwhile are reported as removed.
+    `query` narrows the documents followed, a document leaving the query is reported as removed.
+    """
+    def __init__(self, path: str, apply: Callable, *, query: Optional[Callable] = None) -> None:
+        super().__init__(path, apply)
+        self.query = query
+        # ids of the documents in the collection, to find the ones removed while resubscribing
+        self._ids: set[str] = set()
+    
+    def _reference(self):
+        reference = _sync_client().collection(self.path)
+        return self.query(reference) if self.query is not None else reference
+    
+    def _extract(self, documents, changes, resync: bool) -> dict:
+        if resync:
+            return {doc.id: doc.to_dict() for doc in documents}
+        
+        return {
+            change.document.id: None if change.type.name == "REMOVED" else change.document.to_dict() 
+            for change in changes
+        }
+    
+    def _apply(self, data: dict, resync: bool) -> None:
+        if resync:
+            removed = self._ids - data.keys()
+            self._ids = set(data)
+            data.update((doc_id, None) for doc_id in removed)
+        else:
+            for doc_id, value in data.items():
+                if value is None:
+                    self._ids.discard(doc_id)
+                else:
+                    self._ids.add(doc_id)
+        
+        if data:
+            self.apply(data)
+
+
+_sync = None
+
+
+def _sync_client():
+    """The snapshot listeners are only implemented by the sync client"""
+    global _sync
+    if _sync is None:
+        _sync = firestore.client(firebase_app())
+        
+    return _sync
 
 
 class _FirestoreAsyncClient:
@@ -11,3 +11,34 @@ GOOGLE_APPLICATION_CREDENTIALS = getenv("GOOGLE_APPLICATION_CREDENTIALS")
 
 PORT = getenv("PORT")
 DEBUG_CHANNEL = getenv("DEBUG_CHANNEL")
+
+WARMUP_CONCURRENCY = int(getenv("WARMUP_CONCURRENCY", 8))
+GUILD_CACHE_SIZE = int(getenv("GUILD_CACHE_SIZE", 2048))
+GUILD_CACHE_TTL = float(getenv("GUILD_CACHE_TTL", 3600))
+TREE_HASH_PATH = getenv("TREE_HASH_PATH", ".tree_hash.json")
+FORCE_TREE_SYNC = getenv("FORCE_TREE_SYNC") is not None
+SHARD_COUNT = int(getenv("SHARD_COUNT")) if getenv("SHARD_COUNT") is not None else None
+CLUSTER_COUNT = int(getenv("CLUSTER_COUNT", 1))
+LOG_DIR = getenv("LOG_DIR", "logs")
+GATEWAY_PROFILE = getenv("GATEWAY_PROFILE", "default")
+MESSAGE_CACHE_SIZE = int(getenv("MESSAGE_CACHE_SIZE", 100))
+LOG_QUEUE_SIZE = int(getenv("LOG_QUEUE_SIZE", 500))
+LOG_FLUSH_INTERVAL = float(getenv("LOG_FLUSH_INTERVAL", 5))
+BANNER_CACHE_PATH = getenv("BANNER_CACHE_PATH", ".cache/banners.json")
+RENDER_WORKERS = int(getenv("RENDER_WORKERS", 2))
+RENDER_QUEUE_SIZE = int(getenv("RENDER_QUEUE_SIZE", 16))
+RENDER_TIMEOUT = float(getenv("RENDER_TIMEOUT", 10))
+RENDER_PROCESSES = getenv("RENDER_PROCESSES") is not None
+WRITE_BEHIND_MAX_PENDING = int(getenv("WRITE_BEHIND_MAX_PENDING", 500))
+WRITE_BEHIND_DELAY = float(getenv("WRITE_BEHIND_DELAY", 2))
+DOCUMENT_CACHE_SIZE = int(getenv("DOCUMENT_CACHE_SIZE", 1024))
+DOCUMENT_CACHE_TTL = float(getenv("DOCUMENT_CACHE_TTL", 60))
+FIRESTORE_CONCURRENCY = int(getenv("FIRESTORE_CONCURRENCY", 64))
+FIRESTORE_MAX_RETRIES = int(getenv("FIRESTORE_MAX_RETRIES", 5))
+COUNTER_SHARDS = int(getenv("COUNTER_SHARDS", 10))
+DB_BACKEND = getenv("DB_BACKEND", "firestore")
+SQLITE_PATH = getenv("SQLITE_PATH", ".cache/oneki.db")
+# snapshot listeners are firestore only, with sqlite this process is the only writer
+LIVE_MIRRORS = getenv("DISABLE_LIVE_MIRRORS") is None and DB_BACKEND == "firestore"
+MIRROR_READY_TIMEOUT = float(getenv("MIRROR_READY_TIMEOUT", 30))
+TRANSLATIONS_BUNDLE_PATH = getenv("TRANSLATIONS_BUNDLE_PATH", ".cache/lang.bundle")
@@ -0,0 +1,142 @@
+import discord
+from typing import Any
+
+
+def gateway_options(profile: str, *, message_cache_size: int = 100) -> dict[str, Any]:
+    """Client options of a gateway profile, "default" or "lean"
+
+    The lean profile has no presences intent, caches only the members in voice channels,
+    doesn't chunk the guilds at startup and bounds the message cache to `message_cache_size`.
+    What changes with it:
+    - `info` shows no activity or status.
+    - `guild.get_member` finds only the members in voice channels (and the bot), the code
+      reading members falls back to `guild.query_members` (clubs, the Member converters)
+      or `guild.fetch_member` (server_stats, club approval).
+    - `guild.members` and `role.members` are nearly empty, nothing in the bot reads them.
+    - the message cache only holds the last `message_cache_size` messages, edits and
+      deletes of older ones only reach the raw events.
+    """
+    lean = profile == "lean"
+    options: dict[str, Any] = {
+        "intents": discord.Intents(
+            guilds=True,
+            members=True,
+            presences=not lean,
+            voice_states=True,
+            messages=True,
+            message_content=True,
+            bans=True
+        )
+    }
+
+    if lean:
+        # only members in voice channels are cached, the rest is fetched when a command needs it
+        member_cache_flags = discord.MemberCacheFlags.none()
+        member_cache_flags.voice = True
+
+        options["member_cache_flags"] = member_cache_flags
+        options["chunk_guilds_at_startup"] = False
+        options["max_messages"] = message_cache_size
+
+    return options
+
+
+if __name__ == "__main__":
+    # memory and cpu of each profile fed the same synthetic gateway traffic through discord.py's
+    # ConnectionState (offline, no connection), run from oneki/ with
+    # `python -m utils.gateway [guilds] [members per guild] [presence updates] [messages]`
+    import random
+    import sys
+    import time
+    import tracemalloc
+
+    from discord.state import ChunkRequest, ConnectionState
+
+    args, defaults = [int(arg) for arg in sys.argv[1:5]], [20, 5000, 100_000, 50_000]
+    guilds, members, presences, messages = args + defaults[len(args):]
+    # GUILD_CREATE of a large guild carries at most this many members, the rest come chunked
+    GUILD_CREATE_MEMBERS = 250
+
+    def user(i: int) -> dict:
+        return {"id": str(10**17 + i), "username": f"user{i}", "discriminator": "0", "avatar": None, "global_name": None}
+
+    def member(i: int) -> dict:
+        return {"user": user(i), "roles": [], "joined_at": "2024-01-01T00:00:00+00:00", "deaf": False, "mute": False, "flags": 0}
+
+    def guild_create(guild_id: int, intents: discord.Intents) -> dict:
+        shown = range(guild_id * members, guild_id * members + min(members, GUILD_CREATE_MEMBERS))
+        return {
+            "id": str(guild_id), "name": f"guild{guild_id}", "owner_id": "1", "unavailable": False,
+            "member_count": members, "large": members > GUILD_CREATE_MEMBERS,
+            "members": [member(i) for i in shown],
+            "presences": [{"user": {"id": str(10**17 + i)}, "status": "online", "activities": [], "client_status": {}} for i in shown] if intents.presences else [],
+            "channels": [{"id": str(10**6 + guild_id), "type": 0, "name": "general", "position": 0, "guild_id": str(guild_id), "permission_overwrites": []}],
+            "roles": [{"id": str(guild_id), "name": "@everyone", "permissions": "0", "position": 0, "color": 0, "hoist": False, "managed": False, "mentionable": False, "flags": 0}],
+            "voice_states": [], "threads": [], "stickers": [], "emojis": [], "features": [],
+        }
+
+    def run(profile: str, *, trace: bool = False) -> tuple[float, float, int, int]:
+        options = gateway_options(profile)
+        intents = options["intents"]
+        state = ConnectionState(dispatch=lambda *args, **kwargs: None, handlers={}, hooks={}, http=None, **options)
+        # the chunk requests are answered below, not sent
+        chunk, state._chunk_guilds = state._chunk_guilds, False
+        state._get_client = lambda: None
+        state.user = None
+
+        rng = random.Random(0)
+        if trace:
+            tracemalloc.start()
+            
+        start = time.process_time()
+        for guild_id in range(1, guilds + 1):
+            state.parse_guild_create(guild_create(guild_id, intents))
+            if chunk:
+                # the request discord.py registers when it asks for the members, cached as they arrive
+                request = ChunkRequest(guild_id, 0, None, state._get_guild)
+                state._chunk_requests[request.nonce] = request
+                first, offsets = guild_id * members, range(0, members, 1000)
+                for index, offset in enumerate(offsets):
+                    state.parse_guild_members_chunk({
+                        "guild_id": str(guild_id), "nonce": request.nonce, "chunk_index": index, "chunk_count": len(offsets),
+                        "members": [member(first + i) for i in range(offset, min(offset + 1000, members))]
+                    })
+
+        startup = time.process_time() - start
+        start = time.process_time()
+        # discord only sends presence updates with the presences intent
+        for _ in range(presences if intents.presences else 0):
+            guild_id = rng.randint(1, guilds)
+            i = guild_id * members + rng.randrange(members)
+            state.parse_presence_update({
+                "guild_id": str(guild_id), "user": {"id": str(10**17 + i)},
+                "status": rng.choice(("online", "idle", "dnd")), "activities": [], "client_status": {}
+            })
+
+        for n in range(messages):
+            guild_id = rng.randint(1, guilds)
+            i = guild_id * members + rng.randrange(members)
+            state.parse_message_create({
+                "id": str(10**18 + n), "channel_id": str(10**6 + guild_id), "guild_id": str(guild_id),
+                "author": user(i), "member": {k: v for k, v in member(i).items() if k != "user"},
+                "content": "hello", "timestamp": "2024-01-01T00:00:00+00:00", "edited_timestamp": None,
+                "tts": False, "mention_everyone": False, "mentions": [], "mention_roles": [],
+                "attachments": [], "embeds": [], "pinned": False, "type": 0,
+            })
+
+        events = time.process_time() - start
+        retained = 0
+        if trace:
+            retained, _ = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+        cached = sum(len(guild._members) for guild in state._guilds.values())
+        return startup, events, retained, cached
+
+    print(f"{guilds} guilds x {members} members, {presences} presence updates, {messages} messages")
+    print(f"{'profile':<8} {'startup cpu':>12} {'events cpu':>11} {'retained':>10} {'members':>8}")
+    for profile in ("default", "lean"):
+        # timed without tracemalloc, it slows down every allocation
+        startup, events, _, cached = run(profile)
+        retained = run(profile, trace=True)[2]
+        print(f"{profile:<8} {startup:>11.2f}s {events:>10.2f}s {retained / 2**20:>8.1f}MB {cached:>8}")
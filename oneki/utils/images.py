@@ -0,0 +1,180 @@
+import asyncio
+import concurrent.futures
+import functools
+import io
+import multiprocessing
+
+import discord
+from PIL import Image, ImageDraw, ImageFont
+from typing import Any, Callable, Optional
+
+from . import send_file_and_get_url
+from .cache import LRUCache, PersistentAsyncLRUCache
+from .metrics import metrics
+
+
+def render_banner(colour: tuple[int, int, int], size: tuple[int, int]) -> io.BytesIO:
+    fp = io.BytesIO()
+    Image.new("RGB", size, colour).save(fp, format="PNG")
+    fp.seek(0)
+    return fp
+
+
+VS_TEMPLATE = "resource/img/vs_template.png"
+# boxes of vs_template.png and the bar drawn under them
+VS_BOXES = ((113, 171, 290, 348), (560, 171, 737, 348))
+VS_BAR = (113, 430, 737, 450)
+ORANGE = (255, 178, 71)
+DARK = (24, 23, 29)
+
+
+def _font(size: int) -> ImageFont.ImageFont:
+    try:
+        return ImageFont.truetype("DejaVuSans-Bold.ttf", size)
+    except OSError:
+        return ImageFont.load_default()
+
+
+def _text_size(draw: ImageDraw.ImageDraw, text: str, font: ImageFont.ImageFont) -> tuple[int, int]:
+    try:
+        left, top, right, bottom = draw.textbbox((0, 0), text, font=font)
+        return right - left, bottom - top
+    except (AttributeError, ValueError):
+        # bitmap fonts on older Pillow versions
+        return draw.textsize(text, font=font)
+
+
+def _centered_text(draw: ImageDraw.ImageDraw, center: tuple[int, int], text: str, font: ImageFont.ImageFont, fill) -> None:
+    width, height = _text_size(draw, text, font)
+    draw.text((center[0] - width // 2, center[1] - height // 2), text, font=font, fill=fill)
+
+
+def render_vs_card(template: Image.Image, left: tuple[str, str], right: tuple[str, str], progress: float) -> bytes:
+    """Draws two (label, value) pairs in the boxes of the vs template and a progress bar under them"""
+    image = template.copy()
+    draw = ImageDraw.Draw(image)
+    value_font, label_font = _font(56), _font(24)
+
+    for (x0, y0, x1, y1), (label, value) in zip(VS_BOXES, (left, right)):
+        _centered_text(draw, ((x0 + x1) // 2, (y0 + y1) // 2), value, value_font, DARK)
+        _centered_text(draw, ((x0 + x1) // 2, y1 + 30), label, label_font, "white")
+
+    x0, y0, x1, y1 = VS_BAR
+    draw.rectangle(VS_BAR, outline=ORANGE, width=2)
+    filled = x0 + round((x1 - x0) * max(0.0, min(progress, 100.0)) / 100)
+    if filled > x0:
+        draw.rectangle((x0, y0, filled, y1), fill=ORANGE)
+
+    fp = io.BytesIO()
+    image.save(fp, format="PNG")
+    return fp.getvalue()
+
+
+class Renderer:
+    """Runs image jobs in a bounded pool so Pillow never blocks the event loop
+
+    At most `max_queue` jobs are in the pool at once, the rest wait their turn. A job timed
+    out keeps its slot until it actually ends. The job functions must be picklable (module
+    level) when `processes` is True.
+    """
+    def __init__(self, *, workers: int = 2, max_queue: int = 16, timeout: float = 10.0, processes: bool = False) -> None:
+        if processes:
+            # spawn, the firestore grpc channels are not fork safe
+            self._executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        else:
+            self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+            
+        self._slots = asyncio.Semaphore(max_queue)
+        self.timeout = timeout
+        # jobs submitted or waiting for a slot
+        self.depth = 0
+
+    async def run(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        self.depth += 1
+        try:
+            await self._slots.acquire()
+            try:
+                job = self._executor.submit(functools.partial(func, *args, **kwargs))
+            except BaseException:
+                self._slots.release()
+                raise
+            
+            loop = asyncio.get_running_loop()
+            job.add_done_callback(lambda _: self._release(loop))
+            try:
+                result = await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(job)), self.timeout)
+            except asyncio.TimeoutError:
+                # only a job still waiting for a worker can be cancelled
+                job.cancel()
+                raise
+        except asyncio.TimeoutError:
+            metrics.renders["timeout"] += 1
+            raise
+        except Exception:
+            metrics.renders["failed"] += 1
+            raise
+        finally:
+            self.depth -= 1
+
+        metrics.renders["completed"] += 1
+        return result
+    
+    def _release(self, loop: asyncio.AbstractEventLoop) -> None:
+        # called from the worker thread (or the executor management thread) when the job ends
+        try:
+            loop.call_soon_threadsafe(self._slots.release)
+        except RuntimeError:
+            # the loop is already closed
+            pass
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+class BannerCache:
+    """Uploaded default banners, keyed by the inputs that determine the image so each one is rendered and uploaded once"""
+    SIZE = (600, 240)
+    # the attachment urls are signed and expire about a day after the upload
+    TTL = 12 * 60 * 60
+
+    def __init__(self, bot, *, path: str, maxsize: int = 512) -> None:
+        self.bot = bot
+        self._urls = PersistentAsyncLRUCache(self._upload, path, maxsize, ttl=self.TTL)
+
+    @staticmethod
+    def _key(colour: tuple[int, int, int], size: tuple[int, int]) -> str:
+        return "{:02x}{:02x}{:02x}-{}x{}".format(*colour, *size)
+
+    async def _upload(self, key: str) -> str:
+        colour, size = bytes.fromhex(key[:6]), tuple(int(n) for n in key[7:].split("x"))
+        fp = await self.bot.renderer.run(render_banner, tuple(colour), size)
+        file = discord.File(fp=fp, filename=f"banner_{key}.png")
+        attachment = await send_file_and_get_url(self.bot, file)
+        return attachment.url
+
+    async def get_url(self, colour: tuple[int, int, int], size: tuple[int, int] = SIZE) -> str:
+        return await self._urls.fetch(self._key(colour, size))
+
+
+class StatsCards:
+    """Stats cards drawn over the vs template, the template is decoded once and every card is cached by its values
+
+    The values drawn are the version of the stats, so unchanged stats never render again.
+    """
+    def __init__(self, renderer: Renderer, *, path: str = VS_TEMPLATE, maxsize: int = 256) -> None:
+        self.renderer = renderer
+        with Image.open(path) as template:
+            self._template = template.convert("RGB")
+
+        self._cards = LRUCache(maxsize)
+
+    async def get(self, *, left: tuple[str, str], right: tuple[str, str], progress: float, filename: str = "stats.png") -> discord.File:
+        key = (left, right, progress)
+        data: Optional[bytes] = self._cards.get(key)
+        if data is None:
+            data = await self.renderer.run(render_vs_card, self._template, left, right, progress)
+            self._cards.set(key, data)
+
+        return discord.File(fp=io.BytesIO(data), filename=filename)
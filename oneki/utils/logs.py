@@ -0,0 +1,107 @@
+import asyncio
+import sys
+import traceback
+
+from collections import deque
+from typing import Optional
+
+import discord
+
+from .metrics import metrics
+
+
+MESSAGE_LIMIT = 2000
+
+
+def format_error(header: str, error: BaseException) -> str:
+    tb = "".join(traceback.format_tb(error.__traceback__))
+    return f"{header}\n{tb}{error.__class__.__name__}: {error}"
+
+
+class LogShipper:
+    """Bounded queue of log entries, written to stderr and the debug channel in periodic batches
+
+    `push` never waits, when the queue is full the entry is dropped and the drop is
+    summarized in the next batch. Each flush sends at most `max_messages` messages,
+    the entries that don't fit are summarized too.
+    """
+    def __init__(self, *, maxsize: int = 500, interval: float = 5.0, max_messages: int = 3) -> None:
+        self.maxsize = maxsize
+        self.interval = interval
+        self.max_messages = max_messages
+
+        self.channel: Optional[discord.abc.Messageable] = None
+        self._entries: deque[str] = deque()
+        self._dropped = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def push(self, entry: str) -> None:
+        if len(self._entries) >= self.maxsize:
+            self._dropped += 1
+            metrics.logs["dropped"] += 1
+            return
+
+        self._entries.append(entry)
+        metrics.logs["queued"] += 1
+
+    def start(self, channel: Optional[discord.abc.Messageable]) -> None:
+        self.channel = channel
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+    def _batch(self, entries: list[str], dropped: int) -> list[str]:
+        limit = MESSAGE_LIMIT - 8  # the code block
+        messages, current = [], ""
+        for i, entry in enumerate(entries):
+            entry = entry if len(entry) <= limit else entry[:limit - 4] + "\n..."
+            if current and len(current) + len(entry) + 2 > limit:
+                if len(messages) + 1 == self.max_messages:
+                    dropped += len(entries) - i
+                    break
+
+                messages.append(current)
+                current = ""
+
+            current = f"{current}\n\n{entry}" if current else entry
+
+        if current:
+            messages.append(current)
+
+        messages = [f"```\n{message}\n```" for message in messages]
+        if dropped:
+            messages.append(f"{dropped} log entries were not sent")
+
+        return messages
+
+    async def flush(self) -> None:
+        if not self._entries and not self._dropped:
+            return
+
+        entries, dropped = list(self._entries), self._dropped
+        self._entries.clear()
+        self._dropped = 0
+
+        sys.stderr.write("\n".join(entries) + "\n")
+        if self.channel is None:
+            return
+
+        for message in self._batch(entries, dropped):
+            try:
+                await self.channel.send(message)
+                metrics.logs["sent"] += 1
+            except discord.HTTPException:
+                metrics.logs["failed"] += 1
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+
+        # the entries are already on stderr, a failing send must not abort the shutdown
+        try:
+            await self.flush()
+        except Exception as e:
+            sys.stderr.write(f"[-] Last log flush not sent: {e.__class__.__name__}: {e}\n")
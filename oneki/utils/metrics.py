@@ -0,0 +1,114 @@
+import bisect
+
+from aiohttp import web
+from collections import Counter, defaultdict
+from typing import Callable, Iterable, Optional
+
+
+class Histogram:
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self) -> None:
+        # the last slot is +Inf
+        self.counts = [0] * (len(self.BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name: str, labels: str) -> Iterable[str]:
+        cumulative = 0
+        for bound, n in zip((*self.BUCKETS, "+Inf"), self.counts):
+            cumulative += n
+            yield f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}'
+
+        yield f"{name}_sum{{{labels}}} {self.sum}"
+        yield f"{name}_count{{{labels}}} {self.count}"
+
+
+class Metrics:
+    """Process wide counters, rendered in the prometheus text format"""
+    def __init__(self) -> None:
+        self.commands: defaultdict[str, Histogram] = defaultdict(Histogram)
+        self.events = Counter()
+        self.handlers = Counter()
+        self.firestore = Counter()
+        self.firestore_retries = Counter()
+        self.firestore_shared = Counter()
+        self.logs = Counter()
+        self.renders = Counter()
+        self.write_lag: defaultdict[str, Histogram] = defaultdict(Histogram)
+        # name: callable returning the current value, registered by whoever owns the value
+        self.gauges: dict[str, Callable[[], Optional[float]]] = {}
+
+    def observe_command(self, name: str, elapsed: float) -> None:
+        self.commands[name].observe(elapsed)
+
+    def observe_write_lag(self, collection: str, elapsed: float) -> None:
+        self.write_lag[collection].observe(elapsed)
+
+    def render(self) -> str:
+        lines = ["# TYPE oneki_command_latency_seconds histogram"]
+        for name, histogram in self.commands.items():
+            lines.extend(histogram.render("oneki_command_latency_seconds", f'command="{name}"'))
+
+        lines.append("# TYPE oneki_write_behind_lag_seconds histogram")
+        for collection, histogram in self.write_lag.items():
+            lines.extend(histogram.render("oneki_write_behind_lag_seconds", f'collection="{collection}"'))
+
+        lines.append("# TYPE oneki_events_total counter")
+        lines.extend(f'oneki_events_total{{event="{name}"}} {n}' for name, n in self.events.items())
+
+        lines.append("# TYPE oneki_message_handlers_total counter")
+        lines.extend(f'oneki_message_handlers_total{{handler="{name}"}} {n}' for name, n in self.handlers.items())
+
+        lines.append("# TYPE oneki_firestore_operations_total counter")
+        lines.extend(f'oneki_firestore_operations_total{{op="{op}"}} {n}' for op, n in self.firestore.items())
+
+        lines.append("# TYPE oneki_firestore_retries_total counter")
+        lines.extend(f'oneki_firestore_retries_total{{op="{op}"}} {n}' for op, n in self.firestore_retries.items())
+
+        lines.append("# TYPE oneki_firestore_shared_reads_total counter")
+        lines.extend(f'oneki_firestore_shared_reads_total{{op="{op}"}} {n}' for op, n in self.firestore_shared.items())
+
+        lines.append("# TYPE oneki_log_entries_total counter")
+        lines.extend(f'oneki_log_entries_total{{state="{state}"}} {n}' for state, n in self.logs.items())
+
+        lines.append("# TYPE oneki_render_jobs_total counter")
+        lines.extend(f'oneki_render_jobs_total{{state="{state}"}} {n}' for state, n in self.renders.items())
+
+        for name, gauge in self.gauges.items():
+            value = gauge()
+            if value is not None:
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {value}")
+
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+class MetricsServer:
+    def __init__(self, registry: Metrics = metrics) -> None:
+        self.registry = registry
+        self._runner: Optional[web.AppRunner] = None
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        return web.Response(text=self.registry.render(), content_type="text/plain")
+
+    async def start(self, port: int, host: str = "0.0.0.0") -> None:
+        app = web.Application()
+        app.router.add_get("/metrics", self._handle)
+
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
@@ -0,0 +1,68 @@
+from typing import Iterable, Optional
+
+
+class PrefixMatcher:
+    """Immutable set of prefixes ordered longest first, so `?` never shadows `??`"""
+    __slots__ = ("prefixes",)
+
+    def __init__(self, prefixes: Iterable[str]) -> None:
+        self.prefixes: tuple[str, ...] = tuple(sorted(set(prefixes), key=len, reverse=True))
+
+    def match(self, content: str) -> Optional[str]:
+        # str.startswith with a tuple rejects most messages without a python level loop
+        if not content.startswith(self.prefixes):
+            return None
+
+        for prefix in self.prefixes:
+            if content.startswith(prefix):
+                return prefix
+
+
+if __name__ == "__main__":
+    # prefix resolution per message on a busy guild, up to the prefix discord.py invokes
+    # the command with, run from oneki/ with `python -m utils.prefixes`
+    import timeit
+
+    from discord.ext.commands.view import StringView
+
+    from .cache import LRUCache
+
+    user_id, guild_id = 10**17, 10**16
+    raw = ["?", ">", "o!", "oneki "]
+    prefixes = {guild_id: raw}
+    matchers = LRUCache(1024)
+
+    def rebuilt(content: str) -> Optional[str]:
+        # the baseline _prefix_callable, BotBase.get_prefix and the scan in BotBase.get_context
+        base = [f"<@!{user_id}> ", f"<@{user_id}> "]
+        base.extend(prefixes.get(guild_id) or ["?", ">"])
+        prefix, view = list(base), StringView(content)
+        if content.startswith(tuple(prefix)):
+            return next((p for p in prefix if view.skip_string(p)), None)
+
+    def matcher() -> PrefixMatcher:
+        # OnekiBot.get_prefix_matcher
+        raw = prefixes.get(guild_id) or ["?", ">"]
+        cached = matchers.peek(guild_id)
+        if cached is None or cached[0] is not raw:
+            cached = (raw, PrefixMatcher([f"<@!{user_id}> ", f"<@{user_id}> ", *raw]))
+            matchers.set(guild_id, cached)
+
+        return cached[1]
+
+    def compiled(content: str) -> Optional[str]:
+        # OnekiBot.classify_message, the messages without a prefix get no Context
+        if matcher().match(content) is None:
+            return None
+
+        # OnekiBot.get_prefix gives discord.py the matched prefix
+        prefix, view = matcher().match(content), StringView(content)
+        return prefix if view.skip_string(prefix) else None
+
+    messages = {"chat": "hola a todos, como estan?", "command": "?profile", "mention": f"<@{user_id}> help"}
+    for name, content in messages.items():
+        assert rebuilt(content) == compiled(content)
+        for func in (rebuilt, compiled):
+            number = 500_000
+            elapsed = min(timeit.repeat(lambda: func(content), number=number, repeat=5)) / number
+            print(f"{name:<8} {func.__name__:<9} {elapsed * 1e9:7.0f}ns/message")
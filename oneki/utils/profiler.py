@@ -0,0 +1,76 @@
+import contextlib
+import contextvars
+import functools
+import time
+
+from collections import Counter
+from typing import Optional
+
+
+class Phase:
+    """Wall time and calls made while a phase was active, nested phases also count into their parents"""
+    __slots__ = ("name", "parent", "elapsed", "calls")
+
+    def __init__(self, name: str, parent: Optional["Phase"] = None) -> None:
+        self.name = name
+        self.parent = parent
+        self.elapsed: Optional[float] = None
+        self.calls: Counter = Counter()
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "parent": self.parent.name if self.parent is not None else None,
+            "elapsed_ms": round(self.elapsed * 1000, 1) if self.elapsed is not None else None,
+            "calls": dict(self.calls)
+        }
+
+
+current_phase: contextvars.ContextVar[Optional[Phase]] = contextvars.ContextVar("current_phase", default=None)
+
+
+def record(kind: str, n: int = 1) -> None:
+    """Counts a call of `kind` (firestore, rest, ...) into the active phase and its parents"""
+    phase = current_phase.get()
+    while phase is not None:
+        phase.calls[kind] += n
+        phase = phase.parent
+
+
+def counted(kind: str, func):
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        record(kind)
+        return await func(*args, **kwargs)
+
+    return wrapper
+
+
+class StartupProfiler:
+    def __init__(self) -> None:
+        self.phases: list[Phase] = []
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        phase = Phase(name, current_phase.get())
+        self.phases.append(phase)
+
+        token = current_phase.set(phase)
+        start = time.perf_counter()
+        try:
+            yield phase
+        finally:
+            phase.elapsed = time.perf_counter() - start
+            current_phase.reset(token)
+
+    def to_dict(self) -> list[dict]:
+        return [phase.to_dict() for phase in self.phases]
+
+    def report(self) -> str:
+        lines = [f"{'phase':<28} {'wall':>10} {'firestore':>10} {'rest':>6}"]
+        for phase in self.phases:
+            name = phase.name if phase.parent is None else f"  {phase.name}"
+            elapsed = f"{phase.elapsed * 1000:.1f}ms" if phase.elapsed is not None else "running"
+            lines.append(f"{name:<28} {elapsed:>10} {phase.calls['firestore']:>10} {phase.calls['rest']:>6}")
+
+        return "\n".join(lines)
@@ -0,0 +1,105 @@
+import asyncio
+
+from collections import Counter
+from .metrics import metrics
+from .logs import format_error
+from .costs import attribute
+from typing import Awaitable, Callable, Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import discord
+    from discord.ext import commands
+
+    Handler = Callable[[discord.Message, "MessageInfo"], Awaitable[None]]
+
+
+class MessageInfo:
+    """What the router found out about a message, computed once and shared by every handler"""
+    __slots__ = ("prefix", "command", "watched_mentions")
+
+    def __init__(self, prefix: Optional[str], command: Optional["commands.Command"], watched_mentions: list) -> None:
+        self.prefix = prefix
+        self.command = command
+        self.watched_mentions = watched_mentions
+
+
+class MessageRouter:
+    """Classifies each message once and only calls the handlers interested in it
+
+    Handlers are indexed by channel id (`watch_channel`) and by user id (`watch_user`),
+    a watched user's handlers run when they send a message or when they are mentioned.
+    """
+    def __init__(self, bot: "commands.Bot") -> None:
+        self.bot = bot
+        self._channels: dict[int, "Handler"] = {}
+        self._authors: dict[int, "Handler"] = {}
+        self._mentions: dict[int, "Handler"] = {}
+        self._tasks: set[asyncio.Task] = set()
+        self.stats = Counter()
+
+    def watch_channel(self, channel_id: int, handler: "Handler") -> None:
+        self._channels[channel_id] = handler
+
+    def unwatch_channel(self, channel_id: int) -> None:
+        self._channels.pop(channel_id, None)
+
+    def watch_user(self, user_id: int, *, on_message: "Handler", on_mention: "Handler") -> None:
+        self._authors[user_id] = on_message
+        self._mentions[user_id] = on_mention
+
+    def unwatch_user(self, user_id: int) -> None:
+        self._authors.pop(user_id, None)
+        self._mentions.pop(user_id, None)
+
+    def remove_handler(self, handler: "Handler") -> None:
+        """Drops every route of `handler`, used when its cog is unloaded"""
+        for routes in (self._channels, self._authors, self._mentions):
+            for key in [key for key, value in routes.items() if value == handler]:
+                del routes[key]
+
+    def classify(self, message: "discord.Message", prefix: Optional[str]) -> MessageInfo:
+        command = None
+        if prefix is not None:
+            invoked = message.content[len(prefix):].split(None, 1)
+            if invoked:
+                command = self.bot.all_commands.get(invoked[0])
+
+        watched_mentions = [user for user in message.mentions if user.id in self._mentions] if self._mentions else []
+        return MessageInfo(prefix, command, watched_mentions)
+
+    def dispatch(self, message: "discord.Message", info: MessageInfo) -> None:
+        """Schedules the interested handlers, like discord.py does with listeners"""
+        handlers = []
+        if (handler := self._channels.get(message.channel.id)) is not None:
+            self.stats["channel"] += 1
+            handlers.append(handler)
+
+        if (handler := self._authors.get(message.author.id)) is not None:
+            self.stats["author"] += 1
+            handlers.append(handler)
+
+        # one call per handler, it receives every watched user mentioned in info
+        mention_handlers = {self._mentions[user.id] for user in info.watched_mentions}
+        if mention_handlers:
+            self.stats["mention"] += 1
+            handlers.extend(mention_handlers)
+
+        if info.prefix is not None:
+            self.stats["command"] += 1
+
+        if not handlers:
+            self.stats["skipped"] += 1
+
+        for handler in handlers:
+            task = asyncio.create_task(self._run(handler, message, info))
+            # keep a reference until it is done, the loop only holds weak ones
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, handler: "Handler", message: "discord.Message", info: MessageInfo) -> None:
+        metrics.handlers[handler.__qualname__] += 1
+        try:
+            with attribute(f"handler:{handler.__qualname__}", message.guild.id if message.guild is not None else None):
+                await handler(message, info)
+        except Exception as e:
+            self.bot.logs.push(format_error(f"In message handler {handler.__qualname__}:", e))
@@ -0,0 +1,481 @@
+import datetime
+import inspect
+import json
+import os
+import sqlite3
+import time
+import uuid
+
+from google.api_core import exceptions
+from google.cloud import firestore
+from typing import Any, AsyncGenerator, Awaitable, Callable, Iterable, Optional, Union
+
+from utils.costs import ledger
+
+
+# one json document per row, the path "a/b/c/d" is the collection "a/b/c" and the id "d"
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    collection TEXT NOT NULL,
+    id TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (collection, id)
+) WITHOUT ROWID
+"""
+
+# constant statements, sqlite3 keeps them prepared in the connection statement cache
+SELECT = "SELECT data FROM documents WHERE collection = ? AND id = ?"
+UPSERT = (
+    "INSERT INTO documents (collection, id, data) VALUES (?, ?, ?) "
+    "ON CONFLICT (collection, id) DO UPDATE SET data = excluded.data"
+)
+DELETE = "DELETE FROM documents WHERE collection = ? AND id = ?"
+LIST = "SELECT id FROM documents WHERE collection = ? ORDER BY id"
+
+# where operators, the field path and the value are parameters so each query shape is one prepared statement
+OPERATORS = {
+    "==": "json_extract(data, ?) = ?",
+    "!=": "json_extract(data, ?) != ?",
+    "<": "json_extract(data, ?) < ?",
+    "<=": "json_extract(data, ?) <= ?",
+    ">": "json_extract(data, ?) > ?",
+    ">=": "json_extract(data, ?) >= ?",
+    "array-contains": "EXISTS (SELECT 1 FROM json_each(data, ?) WHERE value = ?)",
+    "in": "json_extract(data, ?) IN (SELECT value FROM json_each(?))",
+}
+
+_MISSING = object()
+
+
+def _split(path: str) -> tuple[str, str]:
+    collection, _, document_id = path.strip("/").rpartition("/")
+    return collection, document_id
+
+
+def _json_path(field_path: str) -> str:
+    # quoted, the keys can be user ids
+    return "$" + "".join(f'."{name}"' for name in field_path.split("."))
+
+
+def _encode(value):
+    if isinstance(value, datetime.datetime):
+        return {"__datetime__": value.isoformat()}
+
+    raise TypeError(f"{value.__class__.__name__} can't be stored")
+
+
+def _decode(value: dict):
+    if "__datetime__" in value and len(value) == 1:
+        return datetime.datetime.fromisoformat(value["__datetime__"])
+
+    return value
+
+
+def _dumps(data: dict) -> str:
+    return json.dumps(data, default=_encode, separators=(",", ":"))
+
+
+def _loads(data: str) -> dict:
+    return json.loads(data, object_hook=_decode)
+
+
+def _transform(old, value):
+    """The value stored when `value` (maybe a sentinel) is written over `old`"""
+    if isinstance(value, firestore.Increment):
+        base = old if isinstance(old, (int, float)) and not isinstance(old, bool) else 0
+        return base + value.value
+
+    if isinstance(value, firestore.ArrayRemove):
+        return [item for item in old if item not in value.values] if isinstance(old, list) else []
+
+    if isinstance(value, firestore.ArrayUnion):
+        base = list(old) if isinstance(old, list) else []
+        return base + [item for item in value.values if item not in base]
+
+    if value is firestore.SERVER_TIMESTAMP:
+        return datetime.datetime.now(datetime.timezone.utc)
+
+    if isinstance(value, dict):
+        # a new map, its values can be sentinels too
+        node = {}
+        for key, item in value.items():
+            _set_path(node, [key], item)
+
+        return node
+
+    return value
+
+
+def _set_path(data: dict, names: list[str], value) -> None:
+    *parents, name = names
+    node = data
+    for parent in parents:
+        child = node.get(parent)
+        if not isinstance(child, dict):
+            if value is firestore.DELETE_FIELD:
+                return
+
+            child = node[parent] = {}
+
+        node = child
+
+    if value is firestore.DELETE_FIELD:
+        node.pop(name, None)
+    else:
+        node[name] = _transform(node.get(name, _MISSING), value)
+
+
+def _get_path(data: dict, names: list[str]):
+    for name in names:
+        if not isinstance(data, dict) or name not in data:
+            return _MISSING
+
+        data = data[name]
+
+    return data
+
+
+def _merge(node: dict, data: dict) -> None:
+    """set(merge=True), the maps are merged key by key instead of replaced"""
+    for key, value in data.items():
+        if isinstance(value, dict) and isinstance(node.get(key), dict):
+            _merge(node[key], value)
+        else:
+            _set_path(node, [key], value)
+
+
+class DocumentSnapshot:
+    __slots__ = ("reference", "_data")
+
+    def __init__(self, reference: "DocumentReference", data: Optional[str]) -> None:
+        self.reference = reference
+        self._data = data
+
+    @property
+    def id(self) -> str:
+        return self.reference.id
+
+    @property
+    def exists(self) -> bool:
+        return self._data is not None
+
+    def to_dict(self) -> Optional[dict]:
+        # decoded on every call, like firestore the caller gets its own copy
+        return _loads(self._data) if self._data is not None else None
+
+    def get(self, field_path: str):
+        value = _get_path(self.to_dict() or {}, field_path.split("."))
+        if value is _MISSING:
+            raise KeyError(field_path)
+
+        return value
+
+
+class DocumentReference:
+    def __init__(self, client: "SQLiteClient", path: str) -> None:
+        self._client = client
+        self.path = path.strip("/")
+        self._collection, self.id = _split(self.path)
+
+    def collection(self, collection_id: str) -> "CollectionReference":
+        return CollectionReference(self._client, f"{self.path}/{collection_id}")
+
+    def _read(self) -> Optional[str]:
+        row = self._client.connection.execute(SELECT, (self._collection, self.id)).fetchone()
+        return row[0] if row is not None else None
+
+    def _write(self, data: dict) -> None:
+        self._client.connection.execute(UPSERT, (self._collection, self.id, _dumps(data)))
+
+    def _set(self, data: dict, merge: Union[bool, Iterable[str]] = False) -> None:
+        if merge is False:
+            document = {}
+            _merge(document, data)
+        else:
+            current = self._read()
+            document = _loads(current) if current is not None else {}
+            if merge is True:
+                _merge(document, data)
+            else:
+                # only the listed field paths, each one replaced whole
+                for field_path in merge:
+                    names = field_path.split(".")
+                    value = _get_path(data, names)
+                    if value is not _MISSING:
+                        _set_path(document, names, value)
+
+        self._write(document)
+
+    def _update(self, data: dict) -> None:
+        current = self._read()
+        if current is None:
+            raise exceptions.NotFound(f"No document to update: {self.path}")
+
+        document = _loads(current)
+        for field_path, value in data.items():
+            _set_path(document, field_path.split("."), value)
+
+        self._write(document)
+
+    async def get(self) -> DocumentSnapshot:
+        return await self._client.call("get", lambda: self._client.run(lambda: DocumentSnapshot(self, self._read())))
+
+    async def set(self, data: dict, merge: Union[bool, Iterable[str]] = False) -> None:
+        await self._client.call("write", lambda: self._client.run(lambda: self._set(data, merge)))
+
+    async def update(self, data: dict) -> None:
+        await self._client.call("write", lambda: self._client.run(lambda: self._update(data)))
+
+    async def delete(self, camp=None) -> None:
+        if camp is not None:
+            return await self.update({camp: firestore.DELETE_FIELD})
+
+        await self._client.call("write", lambda: self._client.run(
+            lambda: self._client.connection.execute(DELETE, (self._collection, self.id))
+        ))
+
+
+class Query:
+    ASCENDING = firestore.Query.ASCENDING
+    DESCENDING = firestore.Query.DESCENDING
+
+    def __init__(self, client: "SQLiteClient", collection: str) -> None:
+        self._client = client
+        self._collection = collection
+        self._filters: list[tuple[str, str, Any]] = []
+        self._orders: list[tuple[str, str]] = []
+        self._limit: Optional[int] = None
+
+    def _copy(self) -> "Query":
+        query = Query(self._client, self._collection)
+        query._filters, query._orders, query._limit = list(self._filters), list(self._orders), self._limit
+        return query
+
+    def where(self, field_path: str, op_string: str, value) -> "Query":
+        if op_string not in OPERATORS:
+            raise ValueError(f"Operator {op_string} is not supported by the sqlite backend")
+
+        query = self._copy()
+        query._filters.append((field_path, op_string, value))
+        return query
+
+    def order_by(self, field_path: str, direction: str = ASCENDING) -> "Query":
+        query = self._copy()
+        query._orders.append((field_path, "DESC" if direction == self.DESCENDING else "ASC"))
+        return query
+
+    def limit(self, count: int) -> "Query":
+        query = self._copy()
+        query._limit = count
+        return query
+
+    def _statement(self) -> tuple[str, list]:
+        sql, params = ["SELECT id, data FROM documents WHERE collection = ?"], [self._collection]
+        for field_path, op_string, value in self._filters:
+            sql.append(f"AND {OPERATORS[op_string]}")
+            params.extend((_json_path(field_path), json.dumps(value) if op_string == "in" else value))
+
+        # like firestore, ordering by a field leaves out the documents without it
+        for field_path, _ in self._orders:
+            sql.append("AND json_extract(data, ?) IS NOT NULL")
+            params.append(_json_path(field_path))
+
+        if self._orders:
+            sql.append("ORDER BY " + ", ".join(f"json_extract(data, ?) {direction}" for _, direction in self._orders))
+            params.extend(_json_path(field_path) for field_path, _ in self._orders)
+
+        if self._limit is not None:
+            sql.append("LIMIT ?")
+            params.append(self._limit)
+
+        return " ".join(sql), params
+
+    def _fetch(self) -> list[DocumentSnapshot]:
+        rows = self._client.connection.execute(*self._statement()).fetchall()
+        return [
+            DocumentSnapshot(DocumentReference(self._client, f"{self._collection}/{document_id}"), data)
+            for document_id, data in rows
+        ]
+
+    async def get(self) -> list[DocumentSnapshot]:
+        return await self._client.call("query", lambda: self._client.run(self._fetch))
+
+    async def stream(self) -> AsyncGenerator[DocumentSnapshot, None]:
+        for doc in await self.get():
+            yield doc
+
+
+class CollectionReference(Query):
+    def __init__(self, client: "SQLiteClient", path: str) -> None:
+        super().__init__(client, path.strip("/"))
+
+    @property
+    def id(self) -> str:
+        return self._collection.rpartition("/")[2]
+
+    def document(self, document_id: Optional[str] = None) -> DocumentReference:
+        return DocumentReference(self._client, f"{self._collection}/{document_id or uuid.uuid4().hex[:20]}")
+
+    async def list_documents(self) -> AsyncGenerator[DocumentReference, None]:
+        rows = await self._client.call("list", lambda: self._client.run(
+            lambda: self._client.connection.execute(LIST, (self._collection,)).fetchall()
+        ))
+        for (document_id,) in rows:
+            yield self.document(document_id)
+
+
+class WriteBatch:
+    def __init__(self, client: "SQLiteClient") -> None:
+        self._client = client
+        self._writes: list[Callable[[], None]] = []
+
+    def set(self, reference: DocumentReference, data: dict, merge: Union[bool, Iterable[str]] = False) -> None:
+        self._writes.append(lambda: reference._set(data, merge))
+
+    def update(self, reference: DocumentReference, data: dict) -> None:
+        self._writes.append(lambda: reference._update(data))
+
+    def delete(self, reference: DocumentReference) -> None:
+        self._writes.append(lambda: self._client.connection.execute(DELETE, (reference._collection, reference.id)))
+
+    async def commit(self) -> list:
+        def commit():
+            for write in self._writes:
+                write()
+
+            return [None] * len(self._writes)
+
+        return self._client.run(commit)
+
+
+class SQLiteClient:
+    """Embedded storage with the interface of `utils.db.AsyncClient` used by the cogs, for single process deployments
+
+    The calls run inline: with WAL and synchronous=NORMAL a commit doesn't wait for the
+    disk, so a call is cheaper than handing it to a thread. That holds while the bot is
+    the only process using the file, with another one a locked BEGIN IMMEDIATE would block
+    the event loop, so more than one cluster is refused. The sentinels (ArrayUnion,
+    ArrayRemove, Increment, DELETE_FIELD) are the firestore ones.
+    """
+    def __init__(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # autocommit, `run` opens a transaction for each call
+        self.connection = sqlite3.connect(path, isolation_level=None, cached_statements=256)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(SCHEMA)
+
+        self.ArrayUnion = firestore.ArrayUnion
+        self.ArrayRemove = firestore.ArrayRemove
+        self.Increment = firestore.Increment
+        self.DELETE_FIELD = firestore.DELETE_FIELD
+        self.Query = Query
+        # the governance of the firestore client has nothing to do here
+        self.cache = None
+        self.queued = 0
+        self.in_flight = 0
+
+    def run(self, func: Callable[[], Any]) -> Any:
+        """Runs `func` in a transaction, the reads and writes of a call are atomic"""
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            result = func()
+        except BaseException:
+            self.connection.execute("ROLLBACK")
+            raise
+
+        self.connection.execute("COMMIT")
+        return result
+
+    async def call(self, op: str, func: Callable[[], Any], *, retryable: tuple = (), documents: int = 1) -> Any:
+        start = time.perf_counter()
+        result = func()
+        if inspect.isawaitable(result):
+            result = await result
+
+        ledger.observe(op, time.perf_counter() - start, max(1, len(result)) if isinstance(result, list) else documents)
+        return result
+
+    async def single_flight(self, op: str, key, func: Callable[[], Awaitable]) -> Any:
+        return await self.call(op, func)
+
+    def invalidate(self, path: str) -> None:
+        pass
+
+    def document(self, *document_path: str) -> DocumentReference:
+        return DocumentReference(self, "/".join(document_path))
+
+    def collection(self, *collection_path: str) -> CollectionReference:
+        return CollectionReference(self, "/".join(collection_path))
+
+    async def get_all(self, references: Iterable[DocumentReference]) -> AsyncGenerator[DocumentSnapshot, None]:
+        references = list(references)
+        docs = await self.call("get_all", lambda: self.run(lambda: [
+            DocumentSnapshot(reference, reference._read()) for reference in references
+        ]))
+        for doc in docs:
+            yield doc
+
+    def batch(self) -> WriteBatch:
+        return WriteBatch(self)
+
+    def close(self) -> None:
+        self.connection.close()
+
+
+if __name__ == "__main__":
+    # latency per operation of the cogs' calls, run from oneki/ with `python -m utils.sqlite [firestore]`.
+    # firestore runs against FIRESTORE_EMULATOR_HOST when set, else the GOOGLE_APPLICATION_CREDENTIALS
+    # project, writing (and then deleting) the documents of the "benchmark" collection
+    import asyncio
+    import statistics
+    import sys
+    import tempfile
+    import warnings
+
+    # the positional where() of the firestore client warns, the cogs call it the same way
+    warnings.simplefilter("ignore", UserWarning)
+
+    async def measure(client, number: int) -> dict[str, list[float]]:
+        docs = [client.document(f"benchmark/{i}") for i in range(number)]
+        collection = client.collection("benchmark")
+
+        async def query():
+            return [doc async for doc in collection.where("n", ">=", 0).order_by("n").limit(10).stream()]
+
+        operations = {
+            "set": lambda doc: doc.set({"n": 0, "users": {"1": {"correct": 0}}}),
+            "get": lambda doc: doc.get(),
+            "update": lambda doc: doc.update({"n": client.Increment(1), "users.1.correct": client.Increment(1)}),
+            "query": lambda doc: query(),
+            "delete": lambda doc: doc.delete(),
+        }
+        timings = {}
+        for name, operation in operations.items():
+            timings[name] = []
+            for doc in docs:
+                start = time.perf_counter()
+                await operation(doc)
+                timings[name].append(time.perf_counter() - start)
+
+        return timings
+
+    async def main():
+        clients = {}
+        with tempfile.TemporaryDirectory() as directory:
+            clients["sqlite"] = (SQLiteClient(os.path.join(directory, "benchmark.db")), 2000)
+            if "firestore" in sys.argv[1:]:
+                from utils import db
+                client = db.AsyncClient() if os.getenv("FIRESTORE_EMULATOR_HOST") else db.async_client()
+                clients["firestore"] = (client, 50)
+
+            print(f"{'backend':<10} {'op':<7} {'p50':>10} {'p95':>10}")
+            for backend, (client, number) in clients.items():
+                timings = await measure(client, number)
+                for name, samples in timings.items():
+                    p50, p95 = statistics.median(samples), statistics.quantiles(samples, n=20)[-1]
+                    print(f"{backend:<10} {name:<7} {p50 * 1e3:8.3f}ms {p95 * 1e3:8.3f}ms")
+
+            clients["sqlite"][0].close()
+
+    asyncio.run(main())
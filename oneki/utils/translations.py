@@ -1,11 +1,15 @@
 import os
 import json
+import struct
+import zlib
 
 from enum import Enum
 from typing import Union, Optional
 
 
 DEFAULT_LANGUAGE = "en"
+BUNDLE_PATH = os.path.join(".cache", "lang.bundle")
+BUNDLE_MAGIC = b"OTB1"
 
 
 class TypeTranslation(Enum):
@@ -16,31 +20,109 @@ class TypeTranslation(Enum):
     
     
 class Translation:
+    """Read-only tree of a translation, lists are stored as tuples"""
     def __init__(self, translation: dict) -> None:
         for k, v in translation.items():
-            if isinstance(v, dict):
-                v = Translation(v)
-                
-            setattr(self, k, v)
+            object.__setattr__(self, k, _freeze(v))
+            
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{self.__class__.__name__} is read-only")
+    
+    def __delattr__(self, name):
+        raise AttributeError(f"{self.__class__.__name__} is read-only")
             
 
+def _freeze(value):
+    if isinstance(value, dict):
+        return Translation(value)
+    
+    if isinstance(value, list):
+        return tuple(_freeze(v) for v in value)
+    
+    return value
+
+
+def _newest_mtime(path) -> float:
+    return max(
+        os.path.getmtime(os.path.join(root, file))
+        for root, _, files in os.walk(path) for file in files
+    )
+
+
+def build_bundle(path: Union[str, os.PathLike] = os.path.join("resource/lang"), bundle_path: str = BUNDLE_PATH) -> None:
+    """Compiles every language directory in one file: magic, header size, json header {lang: [offset, size]}, zlib blocks"""
+    blocks = {}
+    for lang in sorted(os.listdir(path)):
+        lang_translations = {}
+        for cog in sorted(os.listdir(f"{path}/{lang}")):
+            with open(f"{path}/{lang}/{cog}", "r") as f:
+                lang_translations.update(json.loads(f.read()))
+                
+        blocks[lang] = zlib.compress(json.dumps(lang_translations, separators=(",", ":")).encode(), 9)
+    
+    header, offset = {}, 0
+    for lang, block in blocks.items():
+        header[lang] = [offset, len(block)]
+        offset += len(block)
+    
+    header = json.dumps(header).encode()
+    directory = os.path.dirname(bundle_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    
+    # replaced at once, the processes of a cluster starting together may be reading it
+    tmp = f"{bundle_path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(BUNDLE_MAGIC + struct.pack("<I", len(header)) + header + b"".join(blocks.values()))
+        
+    os.replace(tmp, bundle_path)
+
+
+def build_if_stale(path: Union[str, os.PathLike] = os.path.join("resource/lang"), bundle_path: str = BUNDLE_PATH) -> None:
+    """Builds the bundle when it is missing or older than the json files"""
+    if not os.path.exists(bundle_path) or os.path.getmtime(bundle_path) < _newest_mtime(path):
+        build_bundle(path, bundle_path)
+
+
 class Translations:
-    def __init__(self, translations) -> None:
-        self._translations = translations
+    def __init__(self, bundle: bytes) -> None:
+        if bundle[:4] != BUNDLE_MAGIC:
+            raise ValueError("not a translations bundle")
+        
+        (header_size,) = struct.unpack_from("<I", bundle, 4)
+        self._bundle = memoryview(bundle)[8 + header_size:]
+        # lang: (offset, size) in the bundle, the ones still not loaded
+        self._pending: dict[str, tuple[int, int]] = {
+            lang: tuple(block) for lang, block in json.loads(bytes(bundle[8:8 + header_size])).items()
+        }
+        
+        # (lang, type, name): translation, the fallback to DEFAULT_LANGUAGE is already resolved
+        self._catalog: dict[tuple[str, TypeTranslation, str], Translation] = {}
+        self._default: dict[tuple[TypeTranslation, str], Translation] = self._read(DEFAULT_LANGUAGE)
+        self._add_lang(DEFAULT_LANGUAGE, self._default)
+        
+        # locale as received ("es-ES"): lang ("es")
+        self._langs: dict[str, str] = {}
     
     @classmethod
-    def load(cls, path: Optional[Union[str, os.PathLike]] = os.path.join("resource/lang")):
-        translations = {}
-        for lang in os.listdir(path):
-            lang_translations = {}
-            for cog in os.listdir(f"{path}/{lang}"):
-                with open(f"{path}/{lang}/{cog}", "r") as f:
-                    for name, translation in json.loads(f.read()).items():
-                        lang_translations[name] = Translation(translation)
-
-            translations[lang] = lang_translations
+    def load(cls, path: Optional[Union[str, os.PathLike]] = os.path.join("resource/lang"), *, bundle_path: str = BUNDLE_PATH):
+        """Loads the bundle, building it first when it is missing or older than the json files"""
+        build_if_stale(path, bundle_path)
+        with open(bundle_path, "rb") as f:
+            return cls(f.read())
+    
+    def _read(self, lang) -> dict[tuple[TypeTranslation, str], Translation]:
+        offset, size = self._pending.pop(lang)
+        lang_translations = {}
+        for key, translation in json.loads(zlib.decompress(self._bundle[offset:offset + size])).items():
+            type, name = key.split("_", 1)
+            lang_translations[(TypeTranslation(type), name)] = Translation(translation)
         
-        return cls(translations)
+        return lang_translations
+    
+    def _add_lang(self, lang, lang_translations) -> None:
+        for (type, name), translation in {**self._default, **lang_translations}.items():
+            self._catalog[(lang, type, name)] = translation
             
     def _get_translations(self, lang, *, type, name) -> Translation:
         """
@@ -49,25 +131,126 @@ class Translations:
         Event = TypeTranslation.event;
         Function = TypeTranslation.func
         """ 
-        _name = type.value + "_" + name
-        lang = lang.split("-")[0]
+        try:
+            _lang = self._langs[lang]
+        except KeyError:
+            _lang = self._langs[lang] = lang.split("-")[0]
         
-        default_translation = self._translations[DEFAULT_LANGUAGE][_name]
-        translation = self._translations[lang].get(_name, default_translation)
-        return translation
+        try:
+            return self._catalog[(_lang, type, name)]
+        except KeyError:
+            # languages other than the default one are loaded the first time they are requested
+            if _lang in self._pending:
+                self._add_lang(_lang, self._read(_lang))
+                return self._catalog[(_lang, type, name)]
+            
+            return self._catalog[(DEFAULT_LANGUAGE, type, name)]
     
     def command(self, lang, command_name) -> Translation:
-        command_translations = self._get_translations(lang, type=TypeTranslation.command, name=command_name)
-        return command_translations
+        return self._get_translations(lang, type=TypeTranslation.command, name=command_name)
         
     def view(self, lang, interaction_name) -> Translation:
-        command_translations = self._get_translations(lang, type=TypeTranslation.view, name=interaction_name)
-        return command_translations
+        return self._get_translations(lang, type=TypeTranslation.view, name=interaction_name)
     
     def event(self, lang, event_name) -> Translation:
-        event_translations = self._get_translations(lang, type=TypeTranslation.event, name=event_name)
-        return event_translations
+        return self._get_translations(lang, type=TypeTranslation.event, name=event_name)
     
     def function(self, lang, function_name) -> Translation:
-        function_translations = self._get_translations(lang, type=TypeTranslation.func, name=function_name)
-        return function_translations
+        return self._get_translations(lang, type=TypeTranslation.func, name=function_name)
+
+
+if __name__ == "__main__":
+    # from the repository root, `python oneki/utils/translations.py` builds the bundle,
+    # `python oneki/utils/translations.py lookups` times command(), view() and event() and
+    # `python oneki/utils/translations.py load` the startup load time and the memory it keeps,
+    # against the loader and lookups before the catalog and the bundle
+    import sys
+    import timeit
+
+    class BaselineTranslation:
+        def __init__(self, translation: dict) -> None:
+            for k, v in translation.items():
+                if isinstance(v, dict):
+                    v = BaselineTranslation(v)
+
+                setattr(self, k, v)
+
+    class BaselineTranslations:
+        def __init__(self, translations) -> None:
+            self._translations = translations
+
+        @classmethod
+        def load(cls, path: Union[str, os.PathLike] = os.path.join("resource/lang")):
+            translations = {}
+            for lang in os.listdir(path):
+                lang_translations = {}
+                for cog in os.listdir(f"{path}/{lang}"):
+                    with open(f"{path}/{lang}/{cog}", "r") as f:
+                        for name, translation in json.loads(f.read()).items():
+                            lang_translations[name] = BaselineTranslation(translation)
+
+                translations[lang] = lang_translations
+
+            return cls(translations)
+
+        def _get_translations(self, lang, *, type, name):
+            _name = type.value + "_" + name
+            lang = lang.split("-")[0]
+
+            default_translation = self._translations[DEFAULT_LANGUAGE][_name]
+            return self._translations[lang].get(_name, default_translation)
+
+        def command(self, lang, command_name):
+            return self._get_translations(lang, type=TypeTranslation.command, name=command_name)
+
+        def view(self, lang, interaction_name):
+            return self._get_translations(lang, type=TypeTranslation.view, name=interaction_name)
+
+        def event(self, lang, event_name):
+            return self._get_translations(lang, type=TypeTranslation.event, name=event_name)
+
+    def lookups() -> None:
+        baseline, catalog = BaselineTranslations.load(), Translations.load()
+        # the lookups of a counting message, a command and the view it opens
+        calls = {
+            "command": lambda translations: translations.command("es-ES", "user_stats"),
+            "view": lambda translations: translations.view("es-ES", "profile"),
+            "event": lambda translations: translations.event("es-ES", "counting"),
+        }
+        for name, call in calls.items():
+            for label, translations in (("baseline", baseline), ("catalog", catalog)):
+                call(translations)
+                number = 1_000_000
+                elapsed = min(timeit.repeat(lambda: call(translations), number=number, repeat=5)) / number
+                print(f"{name:<8} {label:<9} {elapsed * 1e9:6.0f}ns/call")
+
+    def load() -> None:
+        import gc
+        import tracemalloc
+
+        def bundle_es():
+            # the bundle once a guild used the other language
+            translations = Translations.load()
+            translations.command("es", "user_stats")
+            return translations
+
+        build_if_stale()
+        loaders = {"baseline": BaselineTranslations.load, "bundle": Translations.load, "bundle+es": bundle_es}
+        for label, loader in loaders.items():
+            number = 200
+            elapsed = min(timeit.repeat(loader, number=number, repeat=5)) / number
+
+            gc.collect()
+            tracemalloc.start()
+            translations = loader()
+            retained, _ = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            del translations
+            print(f"{label:<10} {elapsed * 1e3:6.2f}ms/load {retained / 1024:8.1f}KiB retained")
+
+    if sys.argv[1:] == ["lookups"]:
+        lookups()
+    elif sys.argv[1:] == ["load"]:
+        load()
+    else:
+        build_bundle()
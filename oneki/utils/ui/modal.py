@@ -1,9 +1,7 @@
 import discord
 from discord import ui 
 from typing import Optional, TYPE_CHECKING
-
-import sys
-import traceback
+from ..logs import format_error
 
 if TYPE_CHECKING:
     from ..translations import Translation
@@ -46,7 +44,5 @@ class Modal(ui.Modal):
         view = ReportBug(error=error)
         await view.start(interaction)
         
-        print(f"In modal {self}:", file=sys.stderr)
-        traceback.print_tb(error.__traceback__)
-        print(f"{error.__class__.__name__}: {error}", file=sys.stderr)
+        interaction.client.logs.push(format_error(f"In modal {self}:", error))
         
\ No newline at end of file
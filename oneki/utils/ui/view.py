@@ -2,11 +2,9 @@ import discord
 from discord import ui 
 from ..context import Context
 from ..translations import Translation
+from ..logs import format_error
 from typing import Optional, Union
 
-import sys
-import traceback
-
 
 def _can_be_disabled(item):
     return hasattr(item, "disabled")
@@ -128,9 +126,7 @@ class View(ui.View):
         view = ReportBug(error=error)
         await view.start(interaction)
         
-        print(f"In view {self} for item {item}:", file=sys.stderr)
-        traceback.print_tb(error.__traceback__)
-        print(f"{error.__class__.__name__}: {error}", file=sys.stderr)
+        interaction.client.logs.push(format_error(f"In view {self} for item {item}:", error))
         
     async def on_timeout(self) -> None:
         await self.disable()
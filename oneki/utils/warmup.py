@@ -0,0 +1,42 @@
+import asyncio
+import time
+
+from typing import Any, Coroutine
+
+
+class WarmUp:
+    """Runs the startup loaders with a concurrency cap and records how long each one took"""
+    def __init__(self, *, concurrency: int = 8) -> None:
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self.timings: dict[str, float] = {}
+
+    async def run(self, name: str, coro: Coroutine) -> Any:
+        async with self._semaphore:
+            start = time.perf_counter()
+            try:
+                return await coro
+            finally:
+                self.timings[name] = time.perf_counter() - start
+
+    async def gather(self, **loaders: Coroutine) -> list:
+        return await asyncio.gather(*[self.run(name, coro) for name, coro in loaders.items()])
+
+    async def map(self, name: str, func, items) -> list:
+        """Runs `func` over every item sharing the concurrency cap, timed as a single loader"""
+        async def limited(item):
+            async with self._semaphore:
+                return await func(item)
+
+        start = time.perf_counter()
+        try:
+            return await asyncio.gather(*[limited(item) for item in items], return_exceptions=True)
+        finally:
+            self.timings[name] = time.perf_counter() - start
+
+    def report(self) -> str:
+        return format_timings("Warm-up", self.timings)
+
+
+def format_timings(title: str, timings: dict[str, float]) -> str:
+    lines = [f"{name:<20} {elapsed * 1000:>10.1f}ms" for name, elapsed in timings.items()]
+    return "\n".join([f"[+] {title}:", *lines])